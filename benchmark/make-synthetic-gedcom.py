@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+
+"""
+Make a synthetic gedcom file for timing gedcom-display-format.py
+on trees of different shapes and sizes. The same options and seed
+always produce the same file.
+
+This code is released under the MIT License: https://opensource.org/licenses/MIT
+Copyright (c) 2022 John A. Andrea
+
+No support provided.
+"""
+
+import sys
+import io
+import argparse
+import random
+
+# a few non-ascii names so that the html encoding is exercised
+GIVEN_NAMES = ['Anna', 'Bjørn', 'Chloé', 'David', 'Eva', 'François', 'Greta', 'Hugo',
+               'Inés', 'Jan', 'Karl', 'Léa', 'Marta', 'Nils', 'Olga', 'Pål']
+SURNAMES = ['Andersen', 'Brown', 'Côté', 'Dubois', 'Eriksson', 'Fischer', 'García',
+            'Horvát', 'Ivanov', 'Jensen', 'Kowalski', 'López', 'Müller', 'Novak']
+
+FIRST_YEAR = 1500
+GENERATION_YEARS = 28
+
+
+def get_version():
+    return '1.0.0'
+
+
+def get_program_options():
+    results = dict()
+
+    results['people'] = 10000
+    results['generations'] = 12
+    results['children'] = 3.0
+    results['collapse'] = 0.05
+    results['remarry'] = 0.1
+    results['founders'] = 4
+    results['seed'] = 1
+
+    arg_help = 'Make a synthetic gedcom file.'
+    parser = argparse.ArgumentParser( description=arg_help )
+
+    arg_help = 'Show version then exit.'
+    parser.add_argument( '--version', action='version', version=get_version() )
+
+    arg_help = 'Stop after this many people. Default: ' + str(results['people'])
+    parser.add_argument( '--people', default=results['people'], type=int, help=arg_help )
+
+    arg_help = 'Maximum number of generations. Default: ' + str(results['generations'])
+    parser.add_argument( '--generations', default=results['generations'], type=int, help=arg_help )
+
+    arg_help = 'Average number of children in a family. Default: ' + str(results['children'])
+    parser.add_argument( '--children', default=results['children'], type=float, help=arg_help )
+
+    arg_help = 'Chance that a person marries a relative of the same generation (pedigree collapse).'
+    arg_help += ' Default: ' + str(results['collapse'])
+    parser.add_argument( '--collapse', default=results['collapse'], type=float, help=arg_help )
+
+    arg_help = 'Chance that a person has a second marriage. Default: ' + str(results['remarry'])
+    parser.add_argument( '--remarry', default=results['remarry'], type=float, help=arg_help )
+
+    arg_help = 'Number of unrelated founding couples. Default: ' + str(results['founders'])
+    parser.add_argument( '--founders', default=results['founders'], type=int, help=arg_help )
+
+    arg_help = 'Random number seed. Default: ' + str(results['seed'])
+    parser.add_argument( '--seed', default=results['seed'], type=int, help=arg_help )
+
+    args = parser.parse_args()
+
+    results['people'] = args.people
+    results['generations'] = args.generations
+    results['children'] = args.children
+    results['collapse'] = args.collapse
+    results['remarry'] = args.remarry
+    results['founders'] = args.founders
+    results['seed'] = args.seed
+
+    return results
+
+
+def make_tree( settings ):
+    # Returns the people and families as lists of dicts,
+    # a person is referenced by position in the list, as are families.
+
+    rng = random.Random( settings['seed'] )
+
+    people = []
+    families = []
+
+    def add_person( generation, sex, surname, famc=None ):
+        person = dict()
+        person['given'] = rng.choice( GIVEN_NAMES )
+        person['surname'] = surname
+        person['sex'] = sex
+        person['birth'] = FIRST_YEAR + generation * GENERATION_YEARS + rng.randint( -5, 5 )
+        person['death'] = None
+        if rng.random() < 0.7:
+           person['death'] = person['birth'] + rng.randint( 1, 90 )
+        person['famc'] = famc
+        person['fams'] = []
+        people.append( person )
+        return len( people ) - 1
+
+    def add_family( husb, wife ):
+        family = { 'husb':husb, 'wife':wife, 'chil':[] }
+        families.append( family )
+        people[husb]['fams'].append( len( families ) - 1 )
+        people[wife]['fams'].append( len( families ) - 1 )
+        return len( families ) - 1
+
+    def add_spouse( person, generation ):
+        sex = 'F'
+        if people[person]['sex'] == 'F':
+           sex = 'M'
+        return add_person( generation, sex, rng.choice( SURNAMES ) )
+
+    def other_sex( person ):
+        if people[person]['sex'] == 'M':
+           return 'F'
+        return 'M'
+
+    # each generation is the list of families whose children make the next
+    generation_families = []
+    for n in range( settings['founders'] ):
+        husb = add_person( 0, 'M', rng.choice( SURNAMES ) )
+        wife = add_person( 0, 'F', rng.choice( SURNAMES ) )
+        generation_families.append( add_family( husb, wife ) )
+
+    for generation in range( 1, settings['generations'] ):
+        if len( people ) >= settings['people'] or not generation_families:
+           break
+
+        children = []
+        for fam in generation_families:
+            n_children = rng.randint( 0, int( 2 * settings['children'] ) )
+            surname = people[families[fam]['husb']]['surname']
+            for n in range( n_children ):
+                child = add_person( generation, rng.choice( ['M','F'] ), surname, fam )
+                families[fam]['chil'].append( child )
+                children.append( child )
+                if len( people ) >= settings['people']:
+                   break
+            if len( people ) >= settings['people']:
+               break
+
+        # marry the children, some to each other so that lines join again
+        next_families = []
+        married = set()
+        rng.shuffle( children )
+
+        for child in children:
+            if child in married:
+               continue
+
+            partner = None
+            if rng.random() < settings['collapse']:
+               # a cousin, or more distant relative, of the same generation
+               wanted = other_sex( child )
+               for other in rng.sample( children, min( 10, len( children ) ) ):
+                   if other not in married and people[other]['sex'] == wanted:
+                      if people[other]['famc'] != people[child]['famc']:
+                         partner = other
+                         break
+            if partner is None and len( people ) < settings['people']:
+               partner = add_spouse( child, generation )
+            if partner is None:
+               continue
+
+            married.add( child )
+            married.add( partner )
+
+            if people[child]['sex'] == 'M':
+               next_families.append( add_family( child, partner ) )
+            else:
+               next_families.append( add_family( partner, child ) )
+
+            if rng.random() < settings['remarry'] and len( people ) < settings['people']:
+               partner = add_spouse( child, generation )
+               if people[child]['sex'] == 'M':
+                  next_families.append( add_family( child, partner ) )
+               else:
+                  next_families.append( add_family( partner, child ) )
+
+        generation_families = next_families
+
+    return people, families
+
+
+def output_gedcom( people, families ):
+    # gedcom is utf-8 whatever the local setting
+    out = io.TextIOWrapper( sys.stdout.buffer, encoding='utf-8', newline='\n' )
+
+    out.write( '0 HEAD\n1 SOUR make-synthetic-gedcom\n1 GEDC\n2 VERS 5.5.1\n' )
+    out.write( '2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n' )
+
+    for n, person in enumerate( people, start=1 ):
+        out.write( '0 @I%d@ INDI\n' % n )
+        out.write( '1 NAME %s /%s/\n' % ( person['given'], person['surname'] ) )
+        out.write( '1 SEX %s\n' % person['sex'] )
+        out.write( '1 REFN %d\n' % n )
+        out.write( '1 BIRT\n2 DATE %d\n' % person['birth'] )
+        if person['death']:
+           out.write( '1 DEAT\n2 DATE %d\n' % person['death'] )
+        for fam in person['fams']:
+            out.write( '1 FAMS @F%d@\n' % ( fam + 1 ) )
+        if person['famc'] is not None:
+           out.write( '1 FAMC @F%d@\n' % ( person['famc'] + 1 ) )
+
+    for n, family in enumerate( families, start=1 ):
+        out.write( '0 @F%d@ FAM\n' % n )
+        out.write( '1 HUSB @I%d@\n' % ( family['husb'] + 1 ) )
+        out.write( '1 WIFE @I%d@\n' % ( family['wife'] + 1 ) )
+        for child in family['chil']:
+            out.write( '1 CHIL @I%d@\n' % ( child + 1 ) )
+
+    out.write( '0 TRLR\n' )
+    out.flush()
+
+
+options = get_program_options()
+
+people, families = make_tree( options )
+
+print( 'Made', len( people ), 'people in', len( families ), 'families', file=sys.stderr )
+
+output_gedcom( people, families )
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+
+"""
+Time gedcom-display-format.py for each output format and include option
+on synthetic gedcom files of given sizes, or on existing files.
+Wall time and peak memory of each run are written as a json report.
+
+Requires a Unix-like system for the memory measurement.
+
+This code is released under the MIT License: https://opensource.org/licenses/MIT
+Copyright (c) 2022 John A. Andrea
+
+No support provided.
+"""
+
+import sys
+import os
+import argparse
+import json
+import subprocess
+import tempfile
+import time
+import platform
+
+FORMATS = ['dot', 'dot2', 'graphml', 'json', 'cyjs', 'sif', 'csv']
+INCLUDES = ['all', 'ancestors', 'descendents', 'branch', 'path']
+
+# json output is only a tree from one person
+NOT_JSON = ['all', 'branch', 'path']
+
+
+def get_version():
+    return '1.0.0'
+
+
+def get_program_options():
+    results = dict()
+
+    results['sizes'] = '1000,10000'
+    results['gedcom'] = []
+    results['formats'] = ','.join( FORMATS )
+    results['includes'] = ','.join( INCLUDES )
+    results['repeat'] = 1
+    results['report'] = None
+    results['workdir'] = None
+    results['libpath'] = '.'
+    results['personid'] = None
+    results['otherid'] = None
+    results['cache'] = False
+    results['generator'] = []
+
+    arg_help = 'Time gedcom-display-format.py on synthetic or given gedcom files.'
+    parser = argparse.ArgumentParser( description=arg_help )
+
+    arg_help = 'Show version then exit.'
+    parser.add_argument( '--version', action='version', version=get_version() )
+
+    arg_help = 'Comma separated numbers of people for the synthetic files. Default: ' + results['sizes']
+    parser.add_argument( '--sizes', default=results['sizes'], type=str, help=arg_help )
+
+    arg_help = 'An existing gedcom file to time rather than synthetic files. Can be repeated.'
+    parser.add_argument( '--gedcom', action='append', type=str, help=arg_help )
+
+    arg_help = 'Comma separated output formats. Default: ' + results['formats']
+    parser.add_argument( '--formats', default=results['formats'], type=str, help=arg_help )
+
+    arg_help = 'Comma separated include options. Default: ' + results['includes']
+    parser.add_argument( '--includes', default=results['includes'], type=str, help=arg_help )
+
+    arg_help = 'Run each combination this many times and keep the fastest. Default: ' + str(results['repeat'])
+    parser.add_argument( '--repeat', default=results['repeat'], type=int, help=arg_help )
+
+    arg_help = 'Write the json report to this file. Default is stdout.'
+    parser.add_argument( '--report', type=str, help=arg_help )
+
+    arg_help = 'Directory for the synthetic files and output. Default is a temporary directory.'
+    parser.add_argument( '--workdir', type=str, help=arg_help )
+
+    arg_help = 'Location of the gedcom library relative to gedcom-display-format.py. Default: ' + results['libpath']
+    parser.add_argument( '--libpath', default=results['libpath'], type=str, help=arg_help )
+
+    arg_help = 'Xref of the person for the ancestors, descendents and branch options.'
+    arg_help += ' Default is someone in the middle of the file with parents and a family.'
+    parser.add_argument( '--personid', type=str, help=arg_help )
+
+    arg_help = 'Xref of the second person for the path option.'
+    arg_help += ' Default is someone a quarter of the way through the file with parents and a family.'
+    parser.add_argument( '--otherid', type=str, help=arg_help )
+
+    arg_help = 'Allow the parsed data cache, so that only the first run of each file includes parsing.'
+    parser.add_argument( '--cache', default=results['cache'], action='store_true', help=arg_help )
+
+    # passed on to make-synthetic-gedcom.py
+    for item in ['generations', 'children', 'collapse', 'remarry', 'founders', 'seed']:
+        arg_help = 'Passed to make-synthetic-gedcom.py'
+        parser.add_argument( '--' + item, type=str, help=arg_help )
+
+    args = parser.parse_args()
+
+    results['sizes'] = args.sizes
+    if args.gedcom:
+       results['gedcom'] = args.gedcom
+    results['formats'] = args.formats
+    results['includes'] = args.includes
+    results['repeat'] = max( 1, args.repeat )
+    results['report'] = args.report
+    results['workdir'] = args.workdir
+    results['libpath'] = args.libpath
+    results['personid'] = args.personid
+    results['otherid'] = args.otherid
+    results['cache'] = args.cache
+
+    for item in ['generations', 'children', 'collapse', 'remarry', 'founders', 'seed']:
+        value = getattr( args, item )
+        if value is not None:
+           results['generator'].append( '--' + item + '=' + value )
+
+    return results
+
+
+def program_path( name ):
+    # the other programs are found relative to this one
+    here = os.path.dirname( os.path.realpath( __file__ ) )
+    if name == 'gedcom-display-format.py':
+       return os.path.join( here, '..', name )
+    return os.path.join( here, name )
+
+
+def make_gedcom( n_people, generator_options, workdir ):
+    file_name = os.path.join( workdir, 'synthetic-' + str( n_people ) + '.ged' )
+
+    command = [sys.executable, program_path( 'make-synthetic-gedcom.py' ), '--people=' + str( n_people )]
+    command.extend( generator_options )
+
+    print( 'Making', file_name, file=sys.stderr )
+    with open( file_name, 'wb' ) as f:
+         subprocess.run( command, stdout=f, check=True )
+
+    return file_name
+
+
+def pick_person( file_name, fraction=0.5 ):
+    # Someone with parents and a family of their own, from the middle of the file
+    # or the given fraction of the way through, so that all of the include options
+    # have something to show.
+    candidates = []
+
+    xref = None
+    has = set()
+
+    def check():
+        if xref and 'FAMC' in has and 'FAMS' in has:
+           candidates.append( xref )
+
+    with open( file_name, encoding='utf-8', errors='replace' ) as f:
+         for line in f:
+             parts = line.split()
+             if len( parts ) < 2:
+                continue
+             if parts[0] == '0':
+                check()
+                xref = None
+                has = set()
+                if len( parts ) > 2 and parts[2] == 'INDI':
+                   xref = parts[1].replace( '@', '' )
+             elif parts[0] == '1':
+                has.add( parts[1] )
+         check()
+
+    if candidates:
+       return candidates[int( len( candidates ) * fraction )]
+    return None
+
+
+def count_people( file_name ):
+    result = 0
+    with open( file_name, encoding='utf-8', errors='replace' ) as f:
+         for line in f:
+             if line.startswith( '0 ' ) and line.rstrip().endswith( ' INDI' ):
+                result += 1
+    return result
+
+
+def time_run( command, output_name ):
+    # Returns wall seconds, peak memory in kilobytes and exit code.
+    # The memory comes from the resource usage of the finished child process.
+
+    with open( output_name, 'wb' ) as out:
+         start = time.perf_counter()
+         process = subprocess.Popen( command, stdout=out, stderr=subprocess.DEVNULL )
+         pid, status, usage = os.wait4( process.pid, 0 )
+         elapsed = time.perf_counter() - start
+
+    code = -1
+    if os.WIFEXITED( status ):
+       code = os.WEXITSTATUS( status )
+
+    # the process has been reaped, keep Popen from waiting for it again
+    process.returncode = code
+
+    peak = usage.ru_maxrss
+    if sys.platform == 'darwin':
+       # reported in bytes rather than kilobytes
+       peak = peak // 1024
+
+    return elapsed, peak, code
+
+
+def run_one( file_name, out_format, include, settings, workdir ):
+    command = [sys.executable, program_path( 'gedcom-display-format.py' )]
+    command.append( '--libpath=' + settings['libpath'] )
+    command.append( '--format=' + out_format )
+    command.append( '--include=' + include )
+    if include == 'path':
+       command.append( '--personid=' + settings['person'] + ',' + settings['other'] )
+    elif include != 'all':
+       command.append( '--personid=' + settings['person'] )
+    if not settings['cache']:
+       command.append( '--no-cache' )
+    command.append( file_name )
+
+    output_name = os.path.join( workdir, 'output.' + out_format )
+
+    result = dict()
+    result['gedcom'] = file_name
+    result['format'] = out_format
+    result['include'] = include
+    result['wall_seconds'] = None
+    result['peak_rss_kb'] = None
+
+    for n in range( settings['repeat'] ):
+        elapsed, peak, code = time_run( command, output_name )
+        result['exit_code'] = code
+        if result['wall_seconds'] is None or elapsed < result['wall_seconds']:
+           result['wall_seconds'] = round( elapsed, 4 )
+        if result['peak_rss_kb'] is None or peak > result['peak_rss_kb']:
+           result['peak_rss_kb'] = peak
+
+    result['output_bytes'] = os.path.getsize( output_name )
+
+    # csv edges are in a file of their own
+    edges_name = os.path.join( workdir, 'output-edges.' + out_format )
+    if out_format == 'csv' and os.path.isfile( edges_name ):
+       result['output_bytes'] += os.path.getsize( edges_name )
+
+    return result
+
+
+def run_benchmark( settings, workdir ):
+    files = list( settings['gedcom'] )
+    if not files:
+       for size in settings['sizes'].split( ',' ):
+           files.append( make_gedcom( int( size ), settings['generator'], workdir ) )
+
+    results = []
+
+    for file_name in files:
+        settings['person'] = settings['personid']
+        if settings['person'] is None:
+           settings['person'] = pick_person( file_name )
+        settings['other'] = settings['otherid']
+        if settings['other'] is None:
+           settings['other'] = pick_person( file_name, 0.25 )
+
+        n_people = count_people( file_name )
+
+        for include in settings['includes'].split( ',' ):
+            if include != 'all' and settings['person'] is None:
+               print( 'No person to select in', file_name, 'skipping', include, file=sys.stderr )
+               continue
+            if include == 'path' and settings['other'] is None:
+               print( 'No second person to select in', file_name, 'skipping', include, file=sys.stderr )
+               continue
+            for out_format in settings['formats'].split( ',' ):
+                if out_format == 'json' and include in NOT_JSON:
+                   continue
+
+                result = run_one( file_name, out_format, include, settings, workdir )
+                result['people'] = n_people
+                result['personid'] = settings['person']
+                if include == 'path':
+                   result['personid'] += ',' + settings['other']
+                results.append( result )
+
+                print( '%8d %-8s %-12s %9.3f s %9d KB %s' % ( n_people, out_format, include,
+                       result['wall_seconds'], result['peak_rss_kb'],
+                       '' if result['exit_code'] == 0 else 'failed' ), file=sys.stderr )
+
+    return results
+
+
+def write_report( settings, results ):
+    report = dict()
+    report['benchmark_version'] = get_version()
+    report['python'] = platform.python_version()
+    report['platform'] = platform.platform()
+    report['generator_options'] = settings['generator']
+    report['repeat'] = settings['repeat']
+    report['cache'] = settings['cache']
+    report['results'] = results
+
+    if settings['report']:
+       with open( settings['report'], 'w' ) as f:
+            json.dump( report, f, indent=1 )
+    else:
+       json.dump( report, sys.stdout, indent=1 )
+       print( '' )
+
+
+options = get_program_options()
+
+if options['workdir']:
+   os.makedirs( options['workdir'], exist_ok=True )
+   write_report( options, run_benchmark( options, options['workdir'] ) )
+else:
+   with tempfile.TemporaryDirectory() as temp_dir:
+        write_report( options, run_benchmark( options, temp_dir ) )
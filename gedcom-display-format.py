@@ -14,8 +14,29 @@ import sys
 import re
 import argparse
 import json
+import csv
 import importlib.util
 import os
+import gzip
+import hashlib
+import shutil
+import filecmp
+import pickle
+import multiprocessing
+import gc
+import time
+import tracemalloc
+import cProfile
+import contextlib
+import mmap
+import html
+import io
+import threading
+import collections
+import socketserver
+import http.server
+import urllib.parse
+from array import array
 
 # for the connecting lines when the options allow colouring
 # a subset based on https://sashamaps.net/docs/resources/20-colors/
@@ -30,12 +51,854 @@ UNION_COLOR = 'lightsalmon'
 PARENT_CONNECT = 'black'
 CHILD_CONNECT = 'orange'
 UNION_LABEL = '@'
+SUMMARY_COLOR = 'lightgrey'
+
+# the first of each is the default
+FORMATS = ['dot', 'graphml', 'json', 'dot2', 'cyjs', 'sif', 'csv']
+INCLUDES = ['all', 'ancestors', 'anc', 'descendents', 'desc', 'branch', 'br', 'path']
+
+# options which may be set for each job in a batch file, and their types
+BATCH_OPTIONS = {'personid':str, 'include':str, 'format':str, 'output':str,
+                 'iditem':str, 'dates':bool, 'reverse':bool, 'thick':int,
+                 'generations':int, 'refs':bool, 'color-tree':str, 'compress':str,
+                 'detail':int, 'layout':bool, 'color-precedence':str, 'compact':bool,
+                 'color-roots':bool}
+
+# which of the --colouring people colours a family which descends from several,
+# the first is the default
+COLOR_PRECEDENCE = ['order', 'youngest']
+
+# styles of the --stats report, the first is the default
+STATS_FORMATS = ['table', 'json']
+
+# the readers of the gedcom file, the first is the default
+READERS = ['full', 'lean', 'indexed']
+
+# text styles of the names which may be output
+NAME_STYLES = ['html', 'display']
+
+# for removing the surname slashes and anything after them
+NAME_SUFFIX = re.compile( r'/[^/]*$' )
+
+# the parsed data is saved to a file with this ending
+CACHE_SUFFIX = '.display-cache'
+
+# characters of output collected before each write
+BUFFER_SIZE = 65536
+
+# file name endings when splitting into connected groups
+SPLIT_EXTENSIONS = {'dot':'.dot', 'dot2':'.dot', 'graphml':'.graphml', 'cyjs':'.cyjs', 'sif':'.sif',
+                    'csv':'.csv'}
+COMPRESS_EXTENSIONS = {'gzip':'.gz', 'zstd':'.zst'}
+SPLIT_INDEX = 'index.json'
+
+# saved outputs are named by their fingerprint with this ending
+RENDER_SUFFIX = '.render'
+
+# options which change the output made from a selection,
+# the selection itself is part of the fingerprint
+RENDER_OPTIONS = ['format', 'include', 'dates', 'reverse', 'thick', 'generations', 'detail', 'refs',
+                  'layout', 'compact']
+
+# spacing in points of the positions made by --layout,
+# and the number of times the order within the ranks is improved
+LAYOUT_RANK_SEP = 200
+LAYOUT_NODE_SEP = 60
+LAYOUT_SWEEPS = 4
+
+# --serve answers only on this machine, keeping this many recent outputs
+SERVE_HOST = '127.0.0.1'
+SERVE_CACHE_SIZE = 32
+
+# options which may be set in a request to the server, the output always goes back to the request
+SERVE_OPTIONS = [name for name in BATCH_OPTIONS if name not in ['output', 'compress']]
+
+CONTENT_TYPES = {'dot':'text/vnd.graphviz', 'dot2':'text/vnd.graphviz', 'graphml':'application/graphml+xml',
+                 'json':'application/json', 'cyjs':'application/json', 'sif':'text/plain', 'csv':'text/csv'}
 
 
 def get_version():
     return '4.1.1'
 
 
+class OutputSink:
+    """
+    Output text is collected and written in blocks rather than a write
+    for every line. Use write() for text as is, or line() in place of print().
+    """
+
+    def __init__( self, stream, buffer_size=BUFFER_SIZE, close_stream=False ):
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._close_stream = close_stream
+        self._parts = []
+        self._size = 0
+
+    def write( self, text ):
+        self._parts.append( text )
+        self._size += len( text )
+        if self._size >= self._buffer_size:
+           self.flush()
+
+    def line( self, text ):
+        self._parts.append( text )
+        self._parts.append( '\n' )
+        self._size += len( text ) + 1
+        if self._size >= self._buffer_size:
+           self.flush()
+
+    def flush( self ):
+        if self._parts:
+           self._stream.write( ''.join( self._parts ) )
+           self._parts = []
+           self._size = 0
+
+    def close( self ):
+        self.flush()
+        if self._close_stream:
+           self._stream.close()
+        else:
+           self._stream.flush()
+
+
+class JsonWriter:
+    """
+    Json written a piece at a time rather than from a complete structure.
+    The text is the same as from json.dump with an indent of 1,
+    or without any spaces or line breaks when compact.
+    """
+
+    def __init__( self, stream, compact=False ):
+        self._stream = stream
+        self._compact = compact
+        # for each open object or list, whether it has anything in it yet
+        self._open = []
+        self._after_key = False
+
+    def _next_item( self ):
+        # the comma and line break before a key, or a value other than after a key
+        if self._after_key:
+           self._after_key = False
+        elif self._open:
+           if self._open[-1]:
+              self._stream.write( ',' )
+           else:
+              self._open[-1] = True
+           if not self._compact:
+              self._stream.write( '\n' + ' ' * len( self._open ) )
+
+    def begin( self, bracket ):
+        self._next_item()
+        self._stream.write( bracket )
+        self._open.append( False )
+
+    def end( self, bracket ):
+        if self._open.pop() and not self._compact:
+           self._stream.write( '\n' + ' ' * len( self._open ) )
+        self._stream.write( bracket )
+
+    def key( self, name ):
+        self._next_item()
+        self._stream.write( json.dumps( name ) )
+        if self._compact:
+           self._stream.write( ':' )
+        else:
+           self._stream.write( ': ' )
+        self._after_key = True
+
+    def value( self, value ):
+        self._next_item()
+        self._stream.write( json.dumps( value ) )
+
+
+class FamilyGraph:
+    """
+    The people and families numbered in data order, with the links between
+    them held in arrays indexed by those numbers rather than looked up
+    in the nested dicts of the parsed data.
+
+    famc[i] is the family in which person i is a child, or -1.
+    husb[f] and wife[f] are the partners of family f, or -1.
+    The families of person i are fams[fams_start[i]:fams_start[i+1]]
+    and the children of family f are chil[chil_start[f]:chil_start[f+1]].
+
+    Links to records not in the data are left out.
+    """
+
+    def __init__( self, indi_data, fam_data ):
+        self.indi_keys = list( indi_data )
+        self.fam_keys = list( fam_data )
+        self.indi_number = dict( zip( self.indi_keys, range( len( self.indi_keys ) ) ) )
+        self.fam_number = dict( zip( self.fam_keys, range( len( self.fam_keys ) ) ) )
+
+        fam_number = self.fam_number
+        indi_number = self.indi_number
+
+        self.famc = array( 'i' )
+        self.fams_start = array( 'i', [0] )
+        self.fams = array( 'i' )
+
+        for key in self.indi_keys:
+            indi = indi_data[key]
+            famc = -1
+            if 'famc' in indi:
+               famc = fam_number.get( indi['famc'][0], -1 )
+            self.famc.append( famc )
+            if 'fams' in indi:
+               for fam in indi['fams']:
+                   if fam in fam_number:
+                      self.fams.append( fam_number[fam] )
+            self.fams_start.append( len( self.fams ) )
+
+        self.husb = array( 'i' )
+        self.wife = array( 'i' )
+        self.chil_start = array( 'i', [0] )
+        self.chil = array( 'i' )
+
+        for key in self.fam_keys:
+            fam = fam_data[key]
+            for partner, links in [ ('husb', self.husb), ('wife', self.wife) ]:
+                number = -1
+                if partner in fam:
+                   number = indi_number.get( fam[partner][0], -1 )
+                links.append( number )
+            if 'chil' in fam:
+               for child in fam['chil']:
+                   if child in indi_number:
+                      self.chil.append( indi_number[child] )
+            self.chil_start.append( len( self.chil ) )
+
+    def n_indi( self ):
+        return len( self.indi_keys )
+
+    def n_fam( self ):
+        return len( self.fam_keys )
+
+    def families_of( self, indi ):
+        return self.fams[self.fams_start[indi]:self.fams_start[indi+1]]
+
+    def children_of( self, fam ):
+        return self.chil[self.chil_start[fam]:self.chil_start[fam+1]]
+
+    def partners_of( self, fam ):
+        # wife first, the order used by the ancestor walk, skipping missing partners
+        return [ p for p in ( self.wife[fam], self.husb[fam] ) if p >= 0 ]
+
+    def parents_of( self, indi ):
+        fam = self.famc[indi]
+        if fam < 0:
+           return []
+        return self.partners_of( fam )
+
+    def all_children_of( self, indi ):
+        # the children from each of the person's families
+        results = []
+        for fam in self.families_of( indi ):
+            results.extend( self.children_of( fam ) )
+        return results
+
+
+class Selection:
+    """
+    The ids of the people or families chosen for output.
+    Keeps the order in which they were added so that output is repeatable
+    and membership tests are a hash lookup rather than a scan of a list.
+    """
+
+    def __init__( self ):
+        # a dict is used as an ordered set, the values are unused
+        self._items = dict()
+
+    def add( self, item ):
+        # return True if the item was not already selected
+        if item in self._items:
+           return False
+        self._items[item] = None
+        return True
+
+    def clear( self ):
+        self._items.clear()
+
+    def __contains__( self, item ):
+        return item in self._items
+
+    def __iter__( self ):
+        return iter( self._items )
+
+    def __len__( self ):
+        return len( self._items )
+
+
+class LeanReader:
+    """
+    A quick reader of only the parts of a gedcom file which are output:
+    the first name, birth and death years, the family links, and the values
+    of any tags used to find people. The file is scanned once through mmap.
+
+    The results have the same structure as from the readgedcom library
+    so this can be used in its place, but only for those parts.
+    The birth and death years are from the first event of each,
+    and the text is expected to be UTF-8.
+    """
+
+    NAME = 'lean'
+
+    PARSED_INDI = 'individuals'
+    PARSED_FAM = 'families'
+    BEST_EVENT_KEY = 'best-events'
+    UNKNOWN_NAME = '<?>'
+
+    # the xref and type of each record
+    INDI_RECORDS = 'indi-records'
+    FAM_RECORDS = 'fam-records'
+
+    # the values of the tags used to find people are kept in this item
+    IDS = 'ids'
+
+    # the first number of 3 or 4 digits is the lowest year in a date range
+    YEAR = re.compile( rb'\b([0-9]{3,4})\b' )
+
+    def __init__( self, id_tags ):
+        # the lower case names of the tags for finding people,
+        # such as "refn" or a custom event type
+        self.id_tags = set( [ tag.lower() for tag in id_tags ] )
+
+    def read_file( self, file_name ):
+        data = dict()
+        data[self.PARSED_INDI] = dict()
+        data[self.PARSED_FAM] = dict()
+        data[self.INDI_RECORDS] = []
+        data[self.FAM_RECORDS] = []
+
+        # the garbage collector would otherwise keep checking
+        # the many new dicts, none of which can be garbage
+        collecting = gc.isenabled()
+        gc.disable()
+
+        try:
+           with open( file_name, 'rb' ) as f:
+                try:
+                   mapped = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+                except ValueError:
+                   # an empty file can't be mapped
+                   return data
+                with mapped:
+                     self.read_from( file_name, mapped, data )
+
+        finally:
+           if collecting:
+              gc.enable()
+
+        for indi in data[self.PARSED_INDI].values():
+            if not indi['name']:
+               indi['name'].append( self.make_name( '' ) )
+
+        return data
+
+    def read_from( self, file_name, mapped, data ):
+        self.read_lines( iter( mapped.readline, b'' ), data )
+
+    def read_lines( self, lines, data ):
+        indis = data[self.PARSED_INDI]
+        fams = data[self.PARSED_FAM]
+
+        record = None
+        is_indi = False
+        # the level 1 line which level 2 lines would belong to
+        event = None
+
+        for line in lines:
+            parts = line.split( None, 2 )
+            if len( parts ) < 2:
+               continue
+
+            level = parts[0]
+            tag = parts[1]
+
+            if level == b'0' or level == b'\xef\xbb\xbf0':
+               # a new record, the second form has a byte order mark
+               record = None
+               if len( parts ) == 3:
+                  record_type = parts[2].strip()
+                  if record_type in [ b'INDI', b'FAM' ]:
+                     xref = tag.decode( 'utf-8', 'replace' )
+                     key = self.make_key( tag )
+                     record = dict()
+                     is_indi = record_type == b'INDI'
+                     if is_indi:
+                        records = data[self.INDI_RECORDS]
+                        record['name'] = []
+                        record[self.IDS] = dict()
+                        indis[key] = record
+                     else:
+                        records = data[self.FAM_RECORDS]
+                        fams[key] = record
+                     record['file_record'] = { 'key':self.INDI_RECORDS if is_indi else self.FAM_RECORDS,
+                                               'index':len( records ) }
+                     records.append( { 'tag':xref, 'value':record_type.decode() } )
+               continue
+
+            if record is None:
+               continue
+
+            value = b''
+            if len( parts ) == 3:
+               value = parts[2].strip()
+
+            if level == b'1':
+               event = None
+
+               if is_indi:
+                  if tag == b'NAME':
+                     if not record['name']:
+                        record['name'].append( self.make_name( value.decode( 'utf-8', 'replace' ) ) )
+
+                  elif tag in [ b'BIRT', b'DEAT' ]:
+                     event = { 'date':{ 'is_known':False } }
+                     record.setdefault( tag.decode().lower(), [] ).append( event )
+
+                  elif tag in [ b'FAMC', b'FAMS' ]:
+                     record.setdefault( tag.decode().lower(), [] ).append( self.make_key( value ) )
+
+                  elif tag == b'EVEN':
+                     # a custom event, its type may be one of the tags for finding people
+                     event = value
+
+                  elif self.id_tags:
+                     name = tag.decode( 'utf-8', 'replace' ).lower().lstrip( '_' )
+                     if name in self.id_tags:
+                        record[self.IDS][name] = value.decode( 'utf-8', 'replace' )
+
+               elif tag in [ b'HUSB', b'WIFE', b'CHIL' ]:
+                  record.setdefault( tag.decode().lower(), [] ).append( self.make_key( value ) )
+
+            elif level == b'2' and event is not None:
+               if tag == b'DATE' and isinstance( event, dict ):
+                  year = self.YEAR.search( value )
+                  if year:
+                     event['date'] = { 'is_known':True, 'min':{ 'year':int( year.group( 1 ) ) } }
+
+               elif tag == b'TYPE' and isinstance( event, bytes ):
+                  name = value.decode( 'utf-8', 'replace' ).lower()
+                  if name in self.id_tags:
+                     record[self.IDS][name] = event.decode( 'utf-8', 'replace' )
+
+    def make_key( self, xref ):
+        # @I5@ becomes i5
+        return xref.decode( 'utf-8', 'replace' ).replace( '@', '' ).lower()
+
+    def make_name( self, value ):
+        if not value.replace( '/', '' ).strip():
+           return { 'value':value, 'display':self.UNKNOWN_NAME, 'html':self.UNKNOWN_NAME }
+        # non-ascii characters as numbered entities
+        text = html.escape( value, quote=False ).encode( 'ascii', 'xmlcharrefreplace' ).decode( 'ascii' )
+        return { 'value':value, 'display':value, 'html':text }
+
+    def find_individuals( self, data, item, value ):
+        # Returns the keys of the people with the value for the tag.
+        name = item.lower().lstrip( '_' )
+        results = []
+        for key, indi in data[self.PARSED_INDI].items():
+            if indi[self.IDS].get( name ) == value:
+               results.append( key )
+        return results
+
+    def index_individuals( self, data, item ):
+        # Returns the keys of the people with each value of the tag,
+        # found in one pass rather than a pass for each value.
+        name = item.lower().lstrip( '_' )
+        results = dict()
+        for key, indi in data[self.PARSED_INDI].items():
+            if name in indi[self.IDS]:
+               results.setdefault( indi[self.IDS][name], [] ).append( key )
+        return results
+
+
+class LinkView:
+    """
+    One of the links of RecordLinks, indexed by number like the arrays of FamilyGraph.
+    """
+
+    def __init__( self, link ):
+        self.link = link
+
+    def __getitem__( self, n ):
+        return self.link( n )
+
+
+class RecordLinks:
+    """
+    The records reached so far, numbered and linked in the same form as FamilyGraph
+    so that the walks which select the people can also find the records to read.
+    Each record is loaded when it is first reached, a missing link is -1.
+    """
+
+    def __init__( self, load_indi, load_fam ):
+        # each load function returns the record for a key, or None if there isn't one
+        self.load_indi = load_indi
+        self.load_fam = load_fam
+        self.indi_number = dict()
+        self.fam_number = dict()
+        self.indi_records = []
+        self.fam_records = []
+        self.famc = LinkView( self.famc_of )
+        self.husb = LinkView( lambda fam: self.partner_of( fam, 'husb' ) )
+        self.wife = LinkView( lambda fam: self.partner_of( fam, 'wife' ) )
+
+    def number( self, key, load, numbers, records ):
+        if key not in numbers:
+           record = load( key )
+           if record is None:
+              return -1
+           numbers[key] = len( records )
+           records.append( record )
+        return numbers[key]
+
+    def indi( self, key ):
+        return self.number( key, self.load_indi, self.indi_number, self.indi_records )
+
+    def fam( self, key ):
+        return self.number( key, self.load_fam, self.fam_number, self.fam_records )
+
+    def famc_of( self, indi ):
+        # only the first family, as in the graph
+        record = self.indi_records[indi]
+        if record.get( 'famc' ):
+           return self.fam( record['famc'][0] )
+        return -1
+
+    def partner_of( self, fam, tag ):
+        record = self.fam_records[fam]
+        if record.get( tag ):
+           return self.indi( record[tag][0] )
+        return -1
+
+    def families_of( self, indi ):
+        results = []
+        for key in self.indi_records[indi].get( 'fams', [] ):
+            fam = self.fam( key )
+            if fam >= 0:
+               results.append( fam )
+        return results
+
+    def children_of( self, fam ):
+        results = []
+        for key in self.fam_records[fam].get( 'chil', [] ):
+            child = self.indi( key )
+            if child >= 0:
+               results.append( child )
+        return results
+
+    def partners_of( self, fam ):
+        return [ p for p in ( self.wife[fam], self.husb[fam] ) if p >= 0 ]
+
+
+class IndexedReader( LeanReader ):
+    """
+    The lean reader for only the records which can be reached
+    from the chosen people, for the ancestors, descendents and branch options.
+    The byte offset of each record is kept in a sorted index file
+    next to the gedcom file, and searched through mmap, so the time taken
+    depends on the number of records reached rather than the size of the file.
+    The index is made again if the gedcom file changes.
+    """
+
+    NAME = 'indexed'
+
+    def __init__( self, id_tags, starts, cache_dir, use_cache ):
+        # Each start is the key, include and generation limit for a person,
+        # the include is None for a person whose record alone is needed.
+        # With no starts every record is read.
+        super().__init__( id_tags )
+        self.starts = starts
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.offsets = None
+        self.index = None
+        self.index_start = 0
+
+    def read_file( self, file_name ):
+        if self.starts is None:
+           return super().read_file( file_name )
+
+        index_name = cache_file_name( file_name, self.cache_dir, self.NAME )
+
+        f = None
+        if self.use_cache and os.path.isfile( index_name ):
+           f = open( index_name, 'rb' )
+           if not self.open_index( f, file_name ):
+              f.close()
+              f = None
+
+        try:
+           data = super().read_file( file_name )
+        finally:
+           if f:
+              self.index.close()
+              self.index = None
+              f.close()
+
+        if self.offsets is not None and self.use_cache:
+           self.write_index( file_name, index_name )
+
+        print( 'Read', len( data[self.PARSED_INDI] ), 'people and', len( data[self.PARSED_FAM] ), 'families',
+               'through the index', file=sys.stderr )
+
+        return data
+
+    def open_index( self, f, file_name ):
+        # The first line holds the same key as the parsed data cache,
+        # it must match exactly for the index to be used.
+        try:
+           self.index = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+           header = self.index.readline()
+           if json.loads( header.decode( 'utf-8' ) ) == cache_key( file_name ):
+              self.index_start = len( header )
+              return True
+
+        except ( OSError, ValueError ) as e:
+           print( 'Warning: unable to read index:', e, file=sys.stderr )
+
+        if self.index is not None:
+           self.index.close()
+           self.index = None
+        return False
+
+    def write_index( self, file_name, index_name ):
+        # Each line is a key and offset, sorted by key, after the header.
+        # Written to a temporary name first as for the parsed data cache.
+        temp_name = index_name + '.' + str( os.getpid() )
+        try:
+           os.makedirs( os.path.dirname( index_name ), exist_ok=True )
+           with open( temp_name, 'wb' ) as f:
+                f.write( json.dumps( cache_key( file_name ) ).encode( 'utf-8' ) + b'\n' )
+                for key in sorted( self.offsets ):
+                    f.write( key + b'\t' + str( self.offsets[key] ).encode() + b'\n' )
+           os.replace( temp_name, index_name )
+
+        except OSError as e:
+           print( 'Warning: unable to write index', index_name, ':', e, file=sys.stderr )
+           if os.path.isfile( temp_name ):
+              os.remove( temp_name )
+
+    def build_offsets( self, mapped ):
+        # the offset of each person and family record, by key
+        offsets = dict()
+
+        position = 0
+        if mapped[:3] == b'\xef\xbb\xbf':
+           position = 3
+
+        while position >= 0:
+            end = mapped.find( b'\n', position )
+            if end < 0:
+               end = len( mapped )
+            parts = mapped[position:end].split( None, 2 )
+            if len( parts ) == 3 and parts[0] == b'0' and parts[2].strip() in [ b'INDI', b'FAM' ]:
+               offsets[self.make_key( parts[1] ).encode( 'utf-8' )] = position
+            # the start of the next record
+            position = mapped.find( b'\n0 ', end )
+            if position >= 0:
+               position += 1
+
+        return offsets
+
+    def find_offset( self, key ):
+        # returns None if there is no such record
+        key = key.encode( 'utf-8' )
+
+        if self.offsets is not None:
+           return self.offsets.get( key )
+
+        # binary search, the low and high are always at the start of a line
+        index = self.index
+        low = self.index_start
+        high = len( index )
+        while low < high:
+            middle = ( low + high ) // 2
+            start = index.rfind( b'\n', low, middle ) + 1
+            if start == 0:
+               start = low
+            end = index.find( b'\n', start )
+            line_key, offset = index[start:end].split( b'\t' )
+            if line_key == key:
+               return int( offset )
+            if line_key < key:
+               low = end + 1
+            else:
+               high = start
+
+        return None
+
+    def record_lines( self, mapped, offset ):
+        # the lines of the one record which starts at the offset
+        mapped.seek( offset )
+        yield mapped.readline()
+        while True:
+            line = mapped.readline()
+            if not line or line.startswith( b'0' ):
+               return
+            yield line
+
+    def read_from( self, file_name, mapped, data ):
+        if self.starts is None:
+           super().read_from( file_name, mapped, data )
+           return
+
+        if self.index is None:
+           self.offsets = self.build_offsets( mapped )
+
+        indis = data[self.PARSED_INDI]
+        fams = data[self.PARSED_FAM]
+
+        def load( key, records ):
+            # returns None if not in the file
+            if key not in records:
+               offset = self.find_offset( key )
+               if offset is None:
+                  return None
+               self.read_lines( self.record_lines( mapped, offset ), data )
+            return records.get( key )
+
+        links = RecordLinks( lambda key: load( key, indis ), lambda key: load( key, fams ) )
+
+        # The records are found by the same walks as select the people.
+        # The families and people linked to the last generation are also read
+        # as the json output shows them as empty.
+
+        for key, include, generations in self.starts:
+            # the chosen person, even with no links
+            person = links.indi( key )
+            if person < 0:
+               continue
+
+            if include in ['ancestors', 'branch']:
+               boundary = dict()
+               add_ancestors( [person], generations, boundary, links, Selection(), Selection() )
+               for other in boundary:
+                   fam = links.famc[other]
+                   if fam >= 0:
+                      links.partners_of( fam )
+
+            if include in ['descendents', 'branch']:
+               boundary = dict()
+               add_descendents( [person], generations, boundary, links, Selection(), Selection() )
+               for other in boundary:
+                   for fam in links.families_of( other ):
+                       links.partners_of( fam )
+                       links.children_of( fam )
+
+
+class RenderServer( socketserver.ThreadingMixIn, http.server.HTTPServer ):
+    """
+    Answer requests such as /?personid=I42&include=branch&format=dot2
+    from the data loaded once, rather than reading the gedcom file for each output.
+    The data is in the module state, so outputs are made one at a time.
+    The most recent outputs are kept, and the data is loaded again
+    when the gedcom file changes.
+    """
+
+    daemon_threads = True
+
+    def __init__( self, port, program_options ):
+        super().__init__( (SERVE_HOST, port), RenderRequest )
+        self.program_options = program_options
+        self.lock = threading.Lock()
+        self.renders = collections.OrderedDict()
+        self.log = sys.stderr
+        self.modified = file_modified( program_options['infile'] )
+
+    def reload_if_changed( self ):
+        # returns False if the data could not be loaded again
+        modified = file_modified( self.program_options['infile'] )
+        if modified is None or modified == self.modified:
+           # keep using the loaded data while the file is being replaced
+           return True
+
+        print( 'Loading changed file', self.program_options['infile'], file=sys.stderr )
+        self.renders.clear()
+        if not load_data( self.program_options, serve_load_jobs( self.program_options ) ):
+           return False
+        self.modified = modified
+        return True
+
+    def render( self, query ):
+        # Returns the http status, content type and body of the reply.
+
+        with self.lock:
+             # messages go back with a failed request as well as to the log
+             messages = io.StringIO()
+             with contextlib.redirect_stderr( messages ):
+                  status, content_type, body = self.make_reply( query )
+             self.log.write( messages.getvalue() )
+
+             if run_stats is not None:
+                flush_stats( self.program_options['stats-format'] )
+
+             if status != 200:
+                content_type = 'text/plain'
+                body = messages.getvalue()
+
+        return status, content_type, body
+
+    def make_reply( self, query ):
+        if not self.reload_if_changed():
+           return 503, None, None
+
+        try:
+           job = job_settings( query, self.program_options, SERVE_OPTIONS )
+        except ValueError as e:
+           print( 'Problem with request:', e, file=sys.stderr )
+           return 400, None, None
+
+        key = tuple( [ job[name] for name in SERVE_OPTIONS ] )
+        if key in self.renders:
+           self.renders.move_to_end( key )
+           return 200, CONTENT_TYPES[job['format']], self.renders[key]
+
+        output = io.StringIO()
+        if not run_job( job, output ):
+           return 404, None, None
+
+        self.renders[key] = output.getvalue()
+        if len( self.renders ) > SERVE_CACHE_SIZE:
+           self.renders.popitem( last=False )
+
+        return 200, CONTENT_TYPES[job['format']], self.renders[key]
+
+
+class RenderRequest( http.server.BaseHTTPRequestHandler ):
+    """
+    One request to the RenderServer. The options are the query parameters,
+    any not given are those the server was started with.
+    """
+
+    def do_GET( self ):
+        url = urllib.parse.urlsplit( self.path )
+        if url.path != '/':
+           self.reply( 404, 'text/plain', 'Not found\n' )
+           return
+
+        # the last of a repeated option is used
+        query = dict()
+        for name, value in urllib.parse.parse_qsl( url.query ):
+            query[name] = value
+
+        self.reply( *self.server.render( query ) )
+
+    def reply( self, status, content_type, body ):
+        content = body.encode( 'utf-8' )
+        self.send_response( status )
+        self.send_header( 'Content-Type', content_type + '; charset=utf-8' )
+        self.send_header( 'Content-Length', str( len( content ) ) )
+        self.end_headers()
+        self.wfile.write( content )
+
+    def log_message( self, format, *args ):
+        # not to the messages of an output being made by another request
+        self.server.log.write( '%s - %s\n' % ( self.address_string(), format % args ) )
+
+
 def load_my_module( module_name, relative_path ):
     """
     Load a module in my own single .py file. Requires Python 3.6+
@@ -67,17 +930,44 @@ def load_my_module( module_name, relative_path ):
 def get_program_options():
     results = dict()
 
-    results['format'] = 'dot'
+    results['format'] = FORMATS[0]
     results['infile'] = None
-    results['include'] = 'all'
+    results['include'] = INCLUDES[0]
     results['personid'] = None
+    results['personid-file'] = None
     results['iditem'] = 'xref'
     results['dates'] = False
     results['reverse'] = False
     results['thick'] = 1
     results['libpath'] = '.'
+    results['generations'] = None
+    results['detail'] = None
+    results['refs'] = False
+    results['compact'] = False
+    results['output'] = None
+    results['compress'] = None
+    results['buffer'] = BUFFER_SIZE
+    results['cache-dir'] = None
+    results['cache'] = True
+    results['batch'] = None
+    results['jobs'] = 1
+    results['stats'] = False
+    results['stats-format'] = STATS_FORMATS[0]
+    results['profile'] = None
+    results['split'] = None
+    results['min-size'] = 2
+    results['max-size'] = None
+    results['render-cache'] = None
+    results['layout'] = False
+    results['reader'] = READERS[0]
+    results['serve'] = None
+
+    # set for each output when splitting into connected groups
+    results['component'] = None
 
     results['color-tree'] = None
+    results['color-precedence'] = COLOR_PRECEDENCE[0]
+    results['color-roots'] = False
 
     arg_help = 'Convert gedcom to network graph format.'
     parser = argparse.ArgumentParser( description=arg_help )
@@ -85,22 +975,34 @@ def get_program_options():
     arg_help = 'Show version then exit.'
     parser.add_argument( '--version', action='version', version=get_version() )
 
-    formats = [results['format'], 'dot', 'json', 'dot2']
-    arg_help = 'Output format. One of: ' + str(formats) + ', Default: ' + results['format']
-    parser.add_argument( '--format', default=formats, choices=formats, type=str, help=arg_help )
+    arg_help = 'Output format. One of: ' + str(FORMATS) + ', Default: ' + results['format']
+    parser.add_argument( '--format', default=results['format'], choices=FORMATS, type=str, help=arg_help )
 
-    includes = [results['include'], 'ancestors', 'anc', 'descendents', 'desc', 'branch', 'br' ]
     arg_help = 'People to include. Default: ' + results['include']
     arg_help += ' An id for a person is required when not choosing ' + results['include']
-    parser.add_argument( '--include', default=results['include'], choices=includes, type=str, help=arg_help )
+    arg_help += '. "path" takes two ids and shows the shortest connections between them.'
+    parser.add_argument( '--include', default=results['include'], choices=INCLUDES, type=str, help=arg_help )
 
     # if selecting ancestors or descendants, then the id of the selected persom
     # must be included
     # and it may be keyed off of the gedcom id or some other field such as exid or refid, etc
 
     arg_help = 'Id for the person chosen for ancestors or descendents.'
+    arg_help += ' Several people can be given, separated by commas, and are walked together.'
     parser.add_argument( '--personid', type=str, help=arg_help )
 
+    arg_help = 'File of ids for the people chosen, used in place of --personid.'
+    arg_help += ' One or more on each line, separated by commas.'
+    parser.add_argument( '--personid-file', type=str, help=arg_help )
+
+    arg_help = 'Number of generations of ancestors or descendents to include. Default is no limit.'
+    parser.add_argument( '--generations', type=int, help=arg_help )
+
+    arg_help = 'Show full detail only within this many generations of the selected person.'
+    arg_help += ' Beyond that each branch is shown as one node counting the people in it.'
+    arg_help += ' Not for json format.'
+    parser.add_argument( '--detail', type=int, help=arg_help )
+
     arg_help = 'How to find the person. Default is the gedcom id "xref".'
     arg_help += ' Othewise choose "exid", "refnum", etc.'
     parser.add_argument( '--iditem', default=results['iditem'], type=str, help=arg_help )
@@ -108,14 +1010,29 @@ def get_program_options():
     arg_help = 'Show dates along with the names.'
     parser.add_argument( '--dates', default=results['dates'], action='store_true', help=arg_help )
 
+    arg_help = 'For json output, show a person already output as a reference to their id.'
+    parser.add_argument( '--refs', default=results['refs'], action='store_true', help=arg_help )
+
+    arg_help = 'For json and cyjs output, leave out the line breaks and indentation.'
+    parser.add_argument( '--compact', default=results['compact'], action='store_true', help=arg_help )
+
     # in dot files, change direction of the arrows
     arg_help = 'For dot file output, reverse the order of the links.'
     parser.add_argument( '--reverse', default=results['reverse'], action='store_true', help=arg_help )
 
+    arg_help = 'Place the nodes by generation and include the positions in the output,'
+    arg_help += ' as pos for "neato -n" in dot formats or x and y for graphml, cyjs and csv.'
+    parser.add_argument( '--layout', default=results['layout'], action='store_true', help=arg_help )
+
     # this option can be repeated for extra thickness
     arg_help = 'Increase width of connecting lines'
     parser.add_argument( '--thick', action='count', help=arg_help )
 
+    arg_help = 'How to read the gedcom file. One of: ' + str(READERS) + ', Default: ' + results['reader']
+    arg_help += ' The lean reader is quicker and smaller but reads only what is output,'
+    arg_help += ' and finds people only by xref or a tag such as refn. It does not need the library.'
+    parser.add_argument( '--reader', default=results['reader'], choices=READERS, type=str, help=arg_help )
+
     # maybe this should be changed to have a type which better matched a directory
     arg_help = 'Location of the gedcom library. Default is current directory.'
     parser.add_argument( '--libpath', default=results['libpath'], type=str, help=arg_help )
@@ -124,6 +1041,71 @@ def get_program_options():
     arg_help += ' Identified by the --iditem tag. Only for dot and dot2 formats.'
     parser.add_argument( '--colouring', default=None, type=str, help=arg_help )
 
+    arg_help = 'Which colour a family gets when it descends from more than one of the coloured people.'
+    arg_help += ' "order" for the last in the list, "youngest" for the nearest generation.'
+    arg_help += ' Default: ' + results['color-precedence']
+    parser.add_argument( '--colour-precedence', default=results['color-precedence'], choices=COLOR_PRECEDENCE, type=str, help=arg_help )
+
+    arg_help = 'Colour the descendent lines of each of the people in --personid, rather than using --colouring.'
+    arg_help += ' Only for dot and dot2 formats.'
+    parser.add_argument( '--colour-roots', default=results['color-roots'], action='store_true', help=arg_help )
+
+    arg_help = 'Write to this file rather than stdout.'
+    arg_help += ' Output is compressed if the name ends with .gz or .zst'
+    parser.add_argument( '--output', type=str, help=arg_help )
+
+    compressions = ['gzip', 'zstd']
+    arg_help = 'Compress the output. One of: ' + str(compressions)
+    arg_help += ' zstd requires the zstandard module.'
+    parser.add_argument( '--compress', choices=compressions, type=str, help=arg_help )
+
+    arg_help = 'Number of characters collected before each write. Default: ' + str(results['buffer'])
+    parser.add_argument( '--buffer', default=results['buffer'], type=int, help=arg_help )
+
+    arg_help = 'Directory for the saved copy of the parsed gedcom file.'
+    arg_help += ' Default is the same directory as the gedcom file.'
+    parser.add_argument( '--cache-dir', type=str, help=arg_help )
+
+    arg_help = 'Do not use or save a parsed copy of the gedcom file.'
+    parser.add_argument( '--no-cache', default=False, action='store_true', help=arg_help )
+
+    arg_help = 'File of jobs to run on the one gedcom file, json or csv.'
+    arg_help += ' Each job sets options such as personid, include, format and output.'
+    arg_help += ' Other options given here are the defaults for the jobs.'
+    parser.add_argument( '--batch', type=str, help=arg_help )
+
+    arg_help = 'Number of batch jobs to run at the same time. Default: ' + str(results['jobs'])
+    arg_help += ' Each job must have its own output file.'
+    parser.add_argument( '--jobs', default=results['jobs'], type=int, help=arg_help )
+
+    arg_help = 'Show the time and memory used by each phase of the run on stderr.'
+    parser.add_argument( '--stats', default=results['stats'], action='store_true', help=arg_help )
+
+    arg_help = 'How --stats are shown. One of: ' + str(STATS_FORMATS) + ', Default: ' + results['stats-format']
+    parser.add_argument( '--stats-format', default=results['stats-format'], choices=STATS_FORMATS, type=str, help=arg_help )
+
+    arg_help = 'Save cProfile data of the run to this file.'
+    parser.add_argument( '--profile', type=str, help=arg_help )
+
+    arg_help = 'Write each group of connected people to its own file in this directory,'
+    arg_help += ' along with an index file ' + SPLIT_INDEX + '. Requires include "all", not for json format.'
+    parser.add_argument( '--split', type=str, help=arg_help )
+
+    arg_help = 'When splitting, skip groups with fewer people than this. Default: ' + str(results['min-size'])
+    parser.add_argument( '--min-size', default=results['min-size'], type=int, help=arg_help )
+
+    arg_help = 'When splitting, skip groups with more people than this. Default is no limit.'
+    parser.add_argument( '--max-size', type=int, help=arg_help )
+
+    arg_help = 'Directory in which to save each output under a fingerprint of the records and options used.'
+    arg_help += ' An output whose records and options have not changed is copied from there'
+    arg_help += ' and an output file which already matches is not written again.'
+    parser.add_argument( '--render-cache', type=str, help=arg_help )
+
+    arg_help = 'Keep the data loaded and answer requests for outputs on this local port,'
+    arg_help += ' such as /?personid=I42&include=branch&format=dot2 where options not given are those used here.'
+    parser.add_argument( '--serve', type=int, help=arg_help )
+
     parser.add_argument('infile', type=argparse.FileType('r') )
 
     args = parser.parse_args()
@@ -131,30 +1113,373 @@ def get_program_options():
     results['format'] = args.format.lower()
     results['include'] = args.include.lower()
     results['personid'] = args.personid
+    results['personid-file'] = args.personid_file
     results['iditem'] = args.iditem.lower()
     results['dates'] = args.dates
     results['infile'] = args.infile.name
     results['reverse'] = args.reverse
     results['libpath'] = args.libpath
+    results['generations'] = args.generations
+    results['detail'] = args.detail
+    results['refs'] = args.refs
+    results['compact'] = args.compact
+    results['output'] = args.output
+    results['compress'] = args.compress
+    results['buffer'] = args.buffer
+    results['cache-dir'] = args.cache_dir
+    results['cache'] = not args.no_cache
+    results['batch'] = args.batch
+    results['jobs'] = args.jobs
+    results['stats'] = args.stats
+    results['stats-format'] = args.stats_format
+    results['profile'] = args.profile
+    results['split'] = args.split
+    results['min-size'] = args.min_size
+    results['max-size'] = args.max_size
+    results['render-cache'] = args.render_cache
+    results['layout'] = args.layout
+    results['reader'] = args.reader
+    results['serve'] = args.serve
 
     results['color-tree'] = args.colouring
+    results['color-precedence'] = args.colour_precedence
+    results['color-roots'] = args.colour_roots
 
     value = args.thick
     if value:
        results['thick'] += value
 
+    results['include'] = full_include_name( results['include'] )
+
+    return results
+
+
+def full_include_name( include ):
     # change to full words
-    key = 'include'
-    if results[key] in ['anc']:
-       results[key] = 'ancestors'
-    if results[key] in ['desc']:
-       results[key] = 'descendents'
-    if results[key] in ['br']:
-       results[key] = 'branch'
+    if include in ['anc']:
+       include = 'ancestors'
+    if include in ['desc']:
+       include = 'descendents'
+    if include in ['br']:
+       include = 'branch'
+    return include
+
+
+def batch_value( value_type, value ):
+    # values from csv are all strings, json might have the right type already
+    if value_type == bool:
+       if isinstance( value, str ):
+          return value.strip().lower() in ['1', 'true', 'yes', 'y']
+       return bool( value )
+    if value_type == int:
+       return int( value )
+    return str( value ).strip()
+
+
+def job_settings( job, defaults, allowed=BATCH_OPTIONS ):
+    # The options of one job, from a dict of option names and values
+    # such as a line of a batch file, over the defaults.
+    # Raises ValueError if an option is unknown or the options don't go together.
+
+    settings = dict( defaults )
+
+    for key in job:
+        value = job[key]
+        if value is None or value == '':
+           # an empty csv column
+           continue
+        name = key.strip().lower()
+        if name in ['colouring', 'coloring']:
+           name = 'color-tree'
+        if name in ['colour-precedence', 'colour_precedence']:
+           name = 'color-precedence'
+        if name in ['colour-roots', 'colour_roots']:
+           name = 'color-roots'
+        if name not in allowed:
+           raise ValueError( 'unknown option ' + key )
+        try:
+           settings[name] = batch_value( BATCH_OPTIONS[name], value )
+        except ValueError:
+           raise ValueError( 'bad value for ' + key + ': ' + str( value ) )
+
+    for name in ['format', 'include', 'iditem', 'color-precedence']:
+        settings[name] = settings[name].lower()
+    settings['include'] = full_include_name( settings['include'] )
+
+    if settings['format'] not in FORMATS or settings['include'] not in INCLUDES:
+       raise ValueError( 'unknown format or include' )
+    if not options_ok( settings ):
+       raise ValueError( 'options can not be used together' )
+
+    return settings
+
+
+def read_batch( file_name, defaults ):
+    # Read the list of jobs from a json list of objects,
+    # or from a csv file with a header line naming the options.
+    # Returns a list of option settings, or None if there is a problem.
+
+    try:
+       with open( file_name, encoding='utf-8' ) as f:
+            if file_name.lower().endswith( '.json' ):
+               jobs = json.load( f )
+            else:
+               jobs = list( csv.DictReader( f ) )
+
+    except ( OSError, ValueError ) as e:
+       print( 'Unable to read batch file', file_name, ':', e, file=sys.stderr )
+       return None
+
+    if not isinstance( jobs, list ):
+       print( 'Batch file should contain a list of jobs', file=sys.stderr )
+       return None
+
+    results = []
+
+    for n, job in enumerate( jobs, start=1 ):
+        if not isinstance( job, dict ):
+           print( 'Problem with batch job', n, ': it should be a set of options', file=sys.stderr )
+           return None
+        try:
+           results.append( job_settings( job, defaults ) )
+        except ValueError as e:
+           print( 'Problem with batch job', n, ':', e, file=sys.stderr )
+           return None
 
     return results
 
 
+def file_hash( file_name ):
+    h = hashlib.sha256()
+    with open( file_name, 'rb' ) as f:
+         for block in iter( lambda: f.read( 1024 * 1024 ), b'' ):
+             h.update( block )
+    return h.hexdigest()
+
+
+def file_modified( file_name ):
+    # The modification time and size, to notice a changed file. None if it can't be seen.
+    try:
+       info = os.stat( file_name )
+    except OSError:
+       return None
+    return ( info.st_mtime_ns, info.st_size )
+
+
+def cache_file_name( file_name, cache_dir, reader ):
+    # The cache goes next to the input unless another directory is given.
+    # Include a hash of the full path in the name in case a cache directory
+    # is shared by input files of the same name.
+    # Each reader has its own cache as the results are different.
+    full_path = os.path.realpath( file_name )
+    if cache_dir is None:
+       cache_dir = os.path.dirname( full_path )
+    path_hash = hashlib.sha1( full_path.encode( 'utf-8' ) ).hexdigest()[:12]
+    name = os.path.basename( full_path ) + '.' + path_hash
+    if reader != READERS[0]:
+       name += '.' + reader
+    return os.path.join( cache_dir, name + CACHE_SUFFIX )
+
+
+def reader_key():
+    # What the parsed data depends on other than the gedcom file:
+    # the library, or this program and the tags kept by the built in readers.
+    if isinstance( readgedcom, LeanReader ):
+       return [ readgedcom.NAME, os.stat( __file__ ).st_mtime_ns, sorted( readgedcom.id_tags ) ]
+    return [ 'full', os.stat( readgedcom.__file__ ).st_mtime_ns ]
+
+
+def cache_key( file_name ):
+    # Things which must match for the cached data to be used.
+    # Changes to this program or the library may change the data structure.
+    stat = os.stat( file_name )
+    results = dict()
+    results['path'] = os.path.realpath( file_name )
+    results['size'] = stat.st_size
+    results['mtime'] = stat.st_mtime_ns
+    results['version'] = get_version()
+    results['library'] = reader_key()
+    return results
+
+
+def read_cache( file_name, cache_name ):
+    # The cache file holds the key followed by the data.
+    # If the key matches except for the time, such as after a copy or touch,
+    # then the file contents are compared by hash.
+    # Returns None if the cache can't be used.
+
+    if not os.path.isfile( cache_name ):
+       return None
+
+    key = cache_key( file_name )
+
+    try:
+       with open( cache_name, 'rb' ) as f:
+            cached_key = pickle.load( f )
+            same_except_time = True
+            for item in key:
+                if item != 'mtime' and key[item] != cached_key.get( item ):
+                   same_except_time = False
+            if not same_except_time:
+               return None
+            result = pickle.load( f )
+            if key['mtime'] != cached_key['mtime']:
+               if file_hash( file_name ) != cached_key['hash']:
+                  return None
+               # save again with the new time to skip the hash next time
+               write_cache( file_name, cache_name, result )
+            return result
+
+    except ( OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError,
+             ValueError, KeyError, IndexError, TypeError ) as e:
+       print( 'Warning: unable to read cache', cache_name, ':', e, file=sys.stderr )
+       return None
+
+
+def write_cache( file_name, cache_name, parsed_data ):
+    key = cache_key( file_name )
+    key['hash'] = file_hash( file_name )
+
+    # write to a temporary name first so that another run can't see a partial file
+    temp_name = cache_name + '.' + str( os.getpid() )
+    try:
+       os.makedirs( os.path.dirname( cache_name ), exist_ok=True )
+       with open( temp_name, 'wb' ) as f:
+            pickle.dump( key, f, protocol=pickle.HIGHEST_PROTOCOL )
+            pickle.dump( parsed_data, f, protocol=pickle.HIGHEST_PROTOCOL )
+       os.replace( temp_name, cache_name )
+
+    except ( OSError, pickle.PicklingError, TypeError, AttributeError ) as e:
+       print( 'Warning: unable to write cache', cache_name, ':', e, file=sys.stderr )
+       if os.path.isfile( temp_name ):
+          os.remove( temp_name )
+
+
+def read_data( file_name, cache_dir, use_cache, reader ):
+    # parse the gedcom file, or re-use the results of a previous run
+
+    # the indexed reader has its own index file,
+    # and what it reads depends on the people chosen
+    if not use_cache or reader == 'indexed':
+       return readgedcom.read_file( file_name )
+
+    if reader == 'full':
+       # objects in the data from the library need to be found by name when loaded
+       sys.modules.setdefault( 'readgedcom', readgedcom )
+
+    cache_name = cache_file_name( file_name, cache_dir, reader )
+
+    result = read_cache( file_name, cache_name )
+    if result is None:
+       result = readgedcom.read_file( file_name )
+       write_cache( file_name, cache_name, result )
+
+    return result
+
+
+@contextlib.contextmanager
+def stats_phase( name ):
+    # Record the time and peak memory of a part of the run, if --stats was given.
+    # Memory is the peak of Python allocations during the phase if the version
+    # of Python can reset the peak, otherwise the peak so far.
+
+    if run_stats is None:
+       yield
+       return
+
+    if hasattr( tracemalloc, 'reset_peak' ):
+       tracemalloc.reset_peak()
+    start = time.perf_counter()
+
+    try:
+       yield
+    finally:
+       phase = dict()
+       phase['name'] = name
+       phase['seconds'] = time.perf_counter() - start
+       phase['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+       run_stats['phases'].append( phase )
+
+
+def add_stats_count( name, value ):
+    # counts are totals over all jobs in a batch
+    if run_stats is not None:
+       if name not in run_stats['counts']:
+          run_stats['counts'][name] = 0
+       run_stats['counts'][name] += value
+
+
+def report_stats( style ):
+    if style == 'json':
+       json.dump( run_stats, indent=1, fp=sys.stderr )
+       print( '', file=sys.stderr )
+       return
+
+    total = 0.0
+    print( '%-24s %10s %12s' % ( 'phase', 'seconds', 'peak MB' ), file=sys.stderr )
+    for phase in run_stats['phases']:
+        total += phase['seconds']
+        print( '%-24s %10.3f %12.1f' % ( phase['name'], phase['seconds'], phase['peak_bytes'] / 1048576 ), file=sys.stderr )
+    print( '%-24s %10.3f' % ( 'total', total ), file=sys.stderr )
+    for name in run_stats['counts']:
+        print( '%-24s %10d' % ( name, run_stats['counts'][name] ), file=sys.stderr )
+
+
+def flush_stats( style ):
+    # Report the stats so far, if there are any, then start again
+    # so that a server shows each request rather than keeping them all.
+    if run_stats['phases'] or run_stats['counts']:
+       report_stats( style )
+    run_stats['phases'] = []
+    run_stats['counts'] = dict()
+
+
+def output_compression( file_name, compression ):
+    # compression is taken from the file extension if not given
+    if compression is None and file_name:
+       if file_name.endswith( '.gz' ):
+          compression = 'gzip'
+       elif file_name.endswith( '.zst' ):
+          compression = 'zstd'
+    return compression
+
+
+def open_output( file_name, compression, buffer_size ):
+    # Output to the named file or to stdout, possibly compressed.
+    # Returns None if the output can't be opened.
+
+    compression = output_compression( file_name, compression )
+
+    # compressed output to stdout goes to the underlying binary stream
+    target = file_name
+    if target is None:
+       target = sys.stdout.buffer
+
+    try:
+       if compression == 'gzip':
+          stream = gzip.open( target, 'wt', encoding='utf-8' )
+
+       elif compression == 'zstd':
+          try:
+             import zstandard
+          except ImportError:
+             print( 'zstd compression requires the zstandard module', file=sys.stderr )
+             return None
+          stream = zstandard.open( target, 'wt', encoding='utf-8' )
+
+       elif file_name:
+          stream = open( file_name, 'w', encoding='utf-8' )
+
+       else:
+          return OutputSink( sys.stdout, buffer_size )
+
+    except OSError as e:
+       print( 'Unable to open output', file_name, ':', e, file=sys.stderr )
+       return None
+
+    return OutputSink( stream, buffer_size, close_stream=True )
+
+
 def get_indi_years( indi ):
     # return ( birth - death ) or (birth-) or (-death)
     # but None if both dates are empty
@@ -183,30 +1508,59 @@ def get_indi_years( indi ):
     return result
 
 
-def get_name( indi, style, line_break=' ' ):
+def make_name( indi, style ):
     # ouput formats deal with text in different "styles" for non-ascii characters
     # GraphML can dispay HTML encodings.
     # Dot can also display HTML.
+    # Returns None for an unknown name.
 
-    result = 'none'
+    result = data[ikey][indi]['name'][0][style]
+    if readgedcom.UNKNOWN_NAME in result:
+       return None
 
-    if indi is not None:
-       result = data[ikey][indi]['name'][0][style]
-       if readgedcom.UNKNOWN_NAME in result:
-          # change to word with no special characters
-          result = 'unknown'
-       else:
-          # remove any suffix after the end slash
-          result = re.sub( r'/[^/]*$', '', result ).replace('/','').strip()
+    # remove any suffix after the end slash
+    result = NAME_SUFFIX.sub( '', result ).replace('/','').strip()
+
+    if style == 'html':
+       # escape quotes
+       result = result.replace('"','&quot;').replace("'","&rsquo;")
 
-          if style == 'html':
-             # escape quotes
-             result = result.replace('"','&quot;').replace("'","&rsquo;")
+    return result
+
+
+def make_label( indi, style, years ):
+    # the name and the years to go with it
+    name = make_name( indi, style )
+    if name is None:
+       # change to word with no special characters, and no dates
+       return ( 'unknown', None )
+    return ( name, years )
+
+
+def build_labels():
+    # Make the name labels for everyone in one pass
+    # so that they are not re-computed each time a person is output.
+    # Each style is a list in the order of the person numbers.
+    results = dict()
+    for style in NAME_STYLES:
+        results[style] = []
+
+    for indi in graph.indi_keys:
+        years = get_indi_years( indi )
+        for style in NAME_STYLES:
+            results[style].append( make_label( indi, style, years ) )
 
-          if options['dates']:
-             dates = get_indi_years( indi )
-             if dates:
-                result += line_break + dates
+    return results
+
+
+def get_name( indi, style, line_break=' ' ):
+    # indi is a person number
+    result = 'none'
+
+    if indi is not None:
+       result, dates = labels[style][indi]
+       if dates and options['dates']:
+          result += line_break + dates
 
     return result
 
@@ -226,29 +1580,27 @@ def get_name_json( indi ):
     return get_name( indi, 'html', ' ' )
 
 
-def find_other_partner( indi, fam ):
+def find_other_partner( indi, fam, links=None ):
     result = None
 
-    other_partners = dict()
-    other_partners['husb'] = 'wife'
-    other_partners['wife'] = 'husb'
+    if links is None:
+       links = graph
 
-    other = None
-    for partner in other_partners:
-        if partner in data[fkey][fam]:
-           if indi == data[fkey][fam][partner][0]:
-              other = other_partners[partner]
-              break
+    husb = links.husb[fam]
+    wife = links.wife[fam]
 
-    if other:
-       if other in data[fkey][fam]:
-          result = data[fkey][fam][other][0]
+    if indi == husb:
+       if wife >= 0:
+          result = wife
+    elif indi == wife:
+       if husb >= 0:
+          result = husb
 
     return result
 
 
 def graphml_header():
-    print( """\
+    sink.line( """\
 <?xml version="1.0" encoding="UTF-8"?>
 <graphml xmlns="http://graphml.graphdrawing.org/xmlns"
       xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
@@ -258,11 +1610,11 @@ def graphml_header():
 
 
 def graphml_trailer():
-    print( '</graphml>' )
+    sink.line( '</graphml>' )
 
 
-def graphml_setup():
-    print( """\
+def graphml_setup( with_positions ):
+    sink.line( """\
 <key id="d0" for="node" attr.name="name" attr.type="string">
   <default>@</default>
 </key>
@@ -272,85 +1624,138 @@ def graphml_setup():
 <key id="d2" for="edge" attr.name="color" attr.type="string">
   <default>orange</default>
 </key>
+""" )
+    if with_positions:
+       sink.line( """\
+<key id="d3" for="node" attr.name="x" attr.type="double"/>
+<key id="d4" for="node" attr.name="y" attr.type="double"/>
 """ )
 
 
 def begin_graphml():
-    #print( '<graph id="G" edgedefault="undirected">' )
-    print( '<graph id="G" edgedefault="directed">' )
+    #sink.line( '<graph id="G" edgedefault="undirected">' )
+    sink.line( '<graph id="G" edgedefault="directed">' )
 
 
 def end_graphml():
-    print( '</graph>' )
+    sink.line( '</graph>' )
 
 
-def graphml_node( n, color, name ):
-    print( '<node id="n' + str(n) + '">' )
-    print( '  <data key="d0">' + name + '</data>' )
-    print( '  <data key="d1">' + color + '</data>' )
-    print( '</node>' )
+def graphml_node( n, color, name, positions=None ):
+    if positions:
+       x, y = positions[n]
+       sink.write( '<node id="n%d">\n  <data key="d0">%s</data>\n  <data key="d1">%s</data>\n' % ( n, name, color ) )
+       sink.write( '  <data key="d3">%d</data>\n  <data key="d4">%d</data>\n</node>\n' % ( x, y ) )
+    else:
+       sink.write( '<node id="n%d">\n  <data key="d0">%s</data>\n  <data key="d1">%s</data>\n</node>\n' % ( n, name, color ) )
 
 
-def graphml_names( n, node_match ):
+def graphml_names( n, node_match, positions=None ):
     for indi in the_individuals:
         name = get_name_graphml( indi )
         node_match[indi] = n
-        graphml_node( n, NAME_COLOR, name )
+        graphml_node( n, NAME_COLOR, name, positions )
         n += 1
     return n
 
 
-def graphml_unions( n, node_match ):
+def graphml_unions( n, node_match, positions=None ):
     for fam in the_families:
         node_match[fam] = n
         # potentially a marriage date could be used as the label
-        graphml_node( n, UNION_COLOR, UNION_LABEL )
+        graphml_node( n, UNION_COLOR, UNION_LABEL, positions )
         n += 1
     return n
 
 
 def graphml_edge( n, s, t, color ):
-    e = 'e' + str(n)
-    s = 'n' + str(s)
-    t = 'n' + str(t)
-    print( '<edge id="' +e+ '" source="' +s+ '" target="' +t+ '">' )
     if color:
-       print( '  <data key="d2">' + color + '</data>' )
-    print( '</edge>' )
+       sink.write( '<edge id="e%d" source="n%d" target="n%d">\n  <data key="d2">%s</data>\n</edge>\n' % ( n, s, t, color ) )
+    else:
+       sink.write( '<edge id="e%d" source="n%d" target="n%d">\n</edge>\n' % ( n, s, t ) )
 
 
 def graphml_connectors( indi_match, fam_match ):
+    # returns the number of edges
     n = 0
     for fam in the_families:
         fam_target = fam_match[fam]
-        for child in data[fkey][fam]['chil']:
+        for child in graph.children_of( fam ):
             if child in the_individuals:
                child_target = indi_match[child]
                n += 1
                # the child it the target
                graphml_edge( n, fam_target, child_target, CHILD_CONNECT )
-        for parent in ['husb','wife']:
-            if parent in data[fkey][fam]:
-               parent_id = data[fkey][fam][parent][0]
-               if parent_id in the_individuals:
-                  source = indi_match[parent_id]
-                  n += 1
-                  # the union node is the target
-                  graphml_edge( n, source, fam_target, PARENT_CONNECT )
+        for parent_id in [ graph.husb[fam], graph.wife[fam] ]:
+            if parent_id in the_individuals:
+               source = indi_match[parent_id]
+               n += 1
+               # the union node is the target
+               graphml_edge( n, source, fam_target, PARENT_CONNECT )
+
+    return n
+
+
+def graphml_summaries( n, summary_match, positions=None ):
+    for i, summary in enumerate( the_summaries ):
+        summary_match[i] = n
+        graphml_node( n, SUMMARY_COLOR, ' '.join( summary_label( summary[1], summary[2], summary[3] ) ), positions )
+        n += 1
+    return n
+
+
+def graphml_positions( reverse_links ):
+    # The nodes are numbered in the order they are output:
+    # the people, then the unions, then the summaries.
+
+    indi_match = dict()
+    for indi in the_individuals:
+        indi_match[indi] = len( indi_match )
+    fam_match = dict()
+    for fam in the_families:
+        fam_match[fam] = len( indi_match ) + len( fam_match )
+    first_summary = len( indi_match ) + len( fam_match )
+
+    edges = []
+    for fam in the_families:
+        for parent_id in [ graph.husb[fam], graph.wife[fam] ]:
+            if parent_id in the_individuals:
+               edges.append( (indi_match[parent_id], fam_match[fam]) )
+        for child in graph.children_of( fam ):
+            if child in the_individuals:
+               edges.append( (fam_match[fam], indi_match[child]) )
+
+    for i, summary in enumerate( the_summaries ):
+        if summary[1] == 'ancestors':
+           edges.append( (first_summary + i, indi_match[summary[0]]) )
+        else:
+           edges.append( (indi_match[summary[0]], first_summary + i) )
+
+    return layout_positions( first_summary + len( the_summaries ), edges, reverse_links )
+
+
+def graphml_summary_connectors( n, indi_match, summary_match ):
+    # continues the edge numbering from the other connectors,
+    # the ancestors are the source as if they were the parent union
+    for i, summary in enumerate( the_summaries ):
+        n += 1
+        if summary[1] == 'ancestors':
+           graphml_edge( n, summary_match[i], indi_match[summary[0]], CHILD_CONNECT )
+        else:
+           graphml_edge( n, indi_match[summary[0]], summary_match[i], PARENT_CONNECT )
+    return n
 
 
 def dot_header():
-    print( 'digraph family {' )
+    sink.line( 'digraph family {' )
 
 
 def dot_setup( thickness ):
-    print( 'node [shape=record];' )
-    print( 'edge [penwidth=' + str( thickness ) + '];' )
-    print( 'rankdir=LR;' )
+    sink.write( 'node [shape=record];\nedge [penwidth=%s];\nrankdir=LR;\n' % thickness )
 
 
 def dot_trailer():
-    print( '}' )
+    sink.line( '}' )
 
 
 def make_dot_itag( n ):
@@ -375,9 +1780,8 @@ def dot_families( style2, n, indi_nodes, fam_nodes ):
            names['wife'] = '?'
            names['husb'] = '?'
 
-           for partner in names:
-               if partner in data[fkey][fam]:
-                  person_id = data[fkey][fam][partner][0]
+           for partner, person_id in [ ('wife', graph.wife[fam]), ('husb', graph.husb[fam]) ]:
+               if person_id >= 0:
                   # first char of partner matches 'h' and 'w' in structure
                   fam_key = partner[0:1]
                   if style2:
@@ -386,17 +1790,12 @@ def dot_families( style2, n, indi_nodes, fam_nodes ):
                   indi_nodes[person_id] = { 'tag':fam_tag, 'key':fam_key }
                   names[partner] = get_name_dot( person_id )
 
-           out = fam_tag + ' [label="'
            if style2:
               # both parents together, helps with reducing line crossing
-              out += '<u>' + names['husb']
-              out += '\\n& ' + names['wife']
+              sink.write( '%s [label="<u>%s\\n& %s"];\n' % ( fam_tag, names['husb'], names['wife'] ) )
            else:
-              out += '<h>' + names['husb']
-              out += '|<u>|'  # potentially marriage date could go in here
-              out += '<w>' + names['wife']
-           out += '"];'
-           print( out )
+              # potentially marriage date could go in the middle
+              sink.write( '%s [label="<h>%s|<u>|<w>%s"];\n' % ( fam_tag, names['husb'], names['wife'] ) )
 
     return n
 
@@ -407,228 +1806,1159 @@ def dot_not_families( n, indi_nodes ):
         if indi not in indi_nodes:
            # and the person is not in any of the families which are selected
            in_a_fam = False
-           item = 'fams'
-           if item in data[ikey][indi]:
-              for fam in data[ikey][indi][item]:
-                  if fam in the_families:
-                     in_a_fam = True
-                     break
+           for fam in graph.families_of( indi ):
+               if fam in the_families:
+                  in_a_fam = True
+                  break
            if not in_a_fam:
               n += 1
               tag = make_dot_itag(n)
               # 'i' matches structure
               indi_nodes[indi] = { 'tag':tag, 'key':'i' }
 
-              out = tag + ' [label="'
-              out += '<i>' + get_name_dot( indi )
-              out += '"];'
-              print( out )
+              sink.write( '%s [label="<i>%s"];\n' % ( tag, get_name_dot( indi ) ) )
 
     return n
 
 
 def dot_connectors( indi_nodes, fam_nodes, reverse_links, use_colors ):
     # connections from people to their parent unions
+    # returns the number of connections
+
+    n = 0
 
     for indi in the_individuals:
-        if 'famc' in data[ikey][indi]:
-           fam_of_child = data[ikey][indi]['famc'][0]
+        fam_of_child = graph.famc[indi]
+        if fam_of_child >= 0:
            if fam_of_child in the_families:
               color = ''
               if fam_of_child in use_colors:
                   color = ' [penwidth=2, color="' + use_colors[fam_of_child] + '"]'
-              f_link = fam_nodes[fam_of_child]['tag'] +':'+ fam_nodes[fam_of_child]['key']
-              i_link = indi_nodes[indi]['tag'] +':'+ indi_nodes[indi]['key']
+              f_node = fam_nodes[fam_of_child]
+              i_node = indi_nodes[indi]
 
               if reverse_links:
-                 print( i_link + ' -> ' + f_link + color + ';' )
+                 sink.write( '%s:%s -> %s:%s%s;\n' % ( i_node['tag'], i_node['key'], f_node['tag'], f_node['key'], color ) )
               else:
-                 print( f_link + ' -> ' + i_link + color + ';' )
+                 sink.write( '%s:%s -> %s:%s%s;\n' % ( f_node['tag'], f_node['key'], i_node['tag'], i_node['key'], color ) )
+              n += 1
+
+    return n
+
+
+def make_dot_stag( n ):
+    return 's' + str( n )
+
+
+def dot_summaries( n, summary_nodes ):
+    for i, summary in enumerate( the_summaries ):
+        n += 1
+        tag = make_dot_stag( n )
+        summary_nodes[i] = tag
+        label = '\\n'.join( summary_label( summary[1], summary[2], summary[3] ) )
+        sink.write( '%s [label="%s", style=dashed];\n' % ( tag, label ) )
+    return n
+
+
+def dot_summary_connectors( indi_nodes, summary_nodes, reverse_links ):
+    # the ancestors are drawn like a parent family
+    # and the descendents like the children of a family
+    # returns the number of connections
+
+    for i, summary in enumerate( the_summaries ):
+        i_node = indi_nodes[summary[0]]
+        person = i_node['tag'] + ':' + i_node['key']
+        s_node = summary_nodes[i]
+
+        if ( summary[1] == 'ancestors' ) == reverse_links:
+           sink.write( '%s -> %s [style=dashed];\n' % ( person, s_node ) )
+        else:
+           sink.write( '%s -> %s [style=dashed];\n' % ( s_node, person ) )
+
+    return len( the_summaries )
+
+
+def indi_xref( indi ):
+    # the gedcom xref of the numbered person, such as @I5@
+    key = graph.indi_keys[indi]
+    rec_no = data[ikey][key]['file_record']['index']
+    rec_key = data[ikey][key]['file_record']['key']
+    return data[rec_key][rec_no]['tag']
+
+
+def dot_positions( indi_nodes, fam_nodes, summary_nodes, reverse_links ):
+    # Positions for the nodes already output, given as extra attributes.
+    # Each partner's node is their family node so the edges go
+    # from the family of the parents to the node holding the child.
+
+    tags = []
+    for fam in fam_nodes:
+        tags.append( fam_nodes[fam]['tag'] )
+    for indi in indi_nodes:
+        if indi_nodes[indi]['key'] == 'i':
+           tags.append( indi_nodes[indi]['tag'] )
+    for i in summary_nodes:
+        tags.append( summary_nodes[i] )
+
+    node_of = dict()
+    for tag in tags:
+        node_of[tag] = len( node_of )
+
+    edges = []
+    for indi in the_individuals:
+        fam_of_child = graph.famc[indi]
+        if fam_of_child >= 0 and fam_of_child in the_families:
+           edges.append( (node_of[fam_nodes[fam_of_child]['tag']], node_of[indi_nodes[indi]['tag']]) )
+
+    for i, summary in enumerate( the_summaries ):
+        person = node_of[indi_nodes[summary[0]]['tag']]
+        if summary[1] == 'ancestors':
+           edges.append( (node_of[summary_nodes[i]], person) )
+        else:
+           edges.append( (person, node_of[summary_nodes[i]]) )
+
+    positions = layout_positions( len( tags ), edges, reverse_links )
+
+    for tag in tags:
+        sink.write( '%s [pos="%d,%d"];\n' % ( tag, positions[node_of[tag]][0], positions[node_of[tag]][1] ) )
+
+
+def layout_positions( n_nodes, edges, reverse_links ):
+    # Place the nodes without an external layout program.
+    # Each node gets a rank so that the edges go from a lower rank to a higher one,
+    # as the generations do, then the order of the nodes in each rank is improved
+    # by sweeps which move each node to the average place of its neighbours
+    # in the ranks on one side, a quick way to reduce crossing lines.
+    # Returns the (x,y) position in points of each node number.
+
+    parents = [ [] for node in range( n_nodes ) ]
+    children = [ [] for node in range( n_nodes ) ]
+    for source, target in edges:
+        if source != target:
+           children[source].append( target )
+           parents[target].append( source )
+
+    # the longest path from a node with no parents gives the rank,
+    # taking the nodes in topological order; if what is left is all
+    # in a loop, the edges back into the first remaining node are ignored
+
+    rank = [0] * n_nodes
+    done = bytearray( n_nodes )
+    waiting = [ len( links ) for links in parents ]
+    ready = [ node for node in range( n_nodes ) if waiting[node] == 0 ]
+    ready.reverse()
+    order = []
+    first_left = 0
+
+    while len( order ) < n_nodes:
+        if not ready:
+           while done[first_left]:
+               first_left += 1
+           ready.append( first_left )
+        node = ready.pop()
+        if done[node]:
+           continue
+        done[node] = 1
+        order.append( node )
+        for child in children[node]:
+            if not done[child]:
+               if rank[child] <= rank[node]:
+                  rank[child] = rank[node] + 1
+               waiting[child] -= 1
+               if waiting[child] == 0:
+                  ready.append( child )
+
+    # bring the nodes with no parents, such as a person's partner's family,
+    # next to their children rather than all in the first rank
+    for node in range( n_nodes ):
+        if not parents[node] and children[node]:
+           rank[node] = min( [ rank[child] for child in children[node] ] ) - 1
+
+    n_ranks = 0
+    if n_nodes:
+       n_ranks = max( rank ) + 1
+    ranks = [ [] for r in range( n_ranks ) ]
+    for node in order:
+        ranks[rank[node]].append( node )
+
+    # a node's place is measured from the middle of its rank
+    place = [0.0] * n_nodes
+
+    def set_places( nodes ):
+        middle = ( len( nodes ) - 1 ) / 2
+        for i, node in enumerate( nodes ):
+            place[node] = i - middle
+
+    def average_place( node, neighbours ):
+        if neighbours[node]:
+           return sum( [ place[other] for other in neighbours[node] ] ) / len( neighbours[node] )
+        return place[node]
+
+    for nodes in ranks:
+        set_places( nodes )
+
+    for sweep in range( LAYOUT_SWEEPS ):
+        for ranks_in_order, neighbours in [ (ranks, parents), (ranks[::-1], children) ]:
+            for nodes in ranks_in_order:
+                # the sort is stable so ties keep their current order
+                nodes.sort( key=lambda node: average_place( node, neighbours ) )
+                set_places( nodes )
+
+    results = []
+    for node in range( n_nodes ):
+        r = rank[node]
+        if reverse_links:
+           r = n_ranks - 1 - r
+        results.append( ( r * LAYOUT_RANK_SEP, round( place[node] * LAYOUT_NODE_SEP ) ) )
+
+    return results
+
+
+def build_xref_index():
+    # Match each person's gedcom xref, in lower case, to their number
+    # so that finding a person doesn't need a search through everyone.
+    results = dict()
+
+    for n in range( graph.n_indi() ):
+        xref = indi_xref( n ).lower()
+        # assume only one xref indi, keep the first
+        if xref not in results:
+           results[xref] = n
+
+    return results
+
+
+def normal_xref( person ):
+    # ensure the person lookup is the same as what it used in gedcom
+    # if given  5  change to  @I5@
+    person = 'i' + person.lower()
+    person = '@' + person.replace( 'ii', 'i' ) + '@'
+    return person.replace( '@@', '@' )
+
+
+def person_ids( personid ):
+    # the comma separated list of people to start from
+    results = []
+    for person in personid.split( ',' ):
+        if person.strip():
+           results.append( person.strip() )
+    return results
+
+
+def read_person_ids( file_name ):
+    # Ids of the people to start from, one or more on each line separated by commas.
+    # Returns them as a comma separated list, or None if the file can't be read.
+    try:
+       with open( file_name, encoding='utf-8' ) as f:
+            results = []
+            for line in f:
+                results.extend( person_ids( line ) )
+
+    except OSError as e:
+       print( 'Unable to read personid file', file_name, ':', e, file=sys.stderr )
+       return None
+
+    return ','.join( results )
 
 
 def find_person( person, item ):
-    # it is possible that the selected person is not found
+    # Returns a list of person numbers.
+    # It is possible that the selected person is not found
     # or more than one
 
     if item == 'xref':
        result = []
 
-       # ensure the person lookup is the same as what it used in gedcom
-       # if given  5  change to  @I5@
-       person = 'i' + person.lower()
-       person = '@' + person.replace( 'ii', 'i' ) + '@'
-       person = person.replace( '@@', '@' )
+       person = normal_xref( person )
 
-       for indi in data[ikey]:
-           rec_no = data[ikey][indi]['file_record']['index']
-           rec_key = data[ikey][indi]['file_record']['key']
-           if person == data[rec_key][rec_no]['tag'].lower():
-              result.append( indi )
-              # assume only one xref indi
-              break
+       if person in xref_index:
+          result.append( xref_index[person] )
 
        return result
 
-    return readgedcom.find_individuals( data, item, person )
+    if isinstance( readgedcom, LeanReader ):
+       # The built in readers keep the value of each tag for finding people,
+       # so all the values of a tag are indexed in one pass when it is first used.
+       if item not in id_index:
+          id_index[item] = dict()
+          indi_number = graph.indi_number
+          for value, keys in readgedcom.index_individuals( data, item ).items():
+              id_index[item][value] = [ indi_number[key] for key in keys if key in indi_number ]
+
+       return id_index[item].get( person, [] )
+
+    # Other tags may be any name known to readgedcom, such as birth.date
+    # or a custom event, so the matching is left to the library
+    # but each value is searched for only once.
+    if item not in id_index:
+       id_index[item] = dict()
+    if person not in id_index[item]:
+       found = []
+       for indi in readgedcom.find_individuals( data, item, person ):
+           if indi in graph.indi_number:
+              found.append( graph.indi_number[indi] )
+       id_index[item][person] = found
+
+    return id_index[item][person]
+
+
+def add_ancestors( people, generations=None, boundary=None, links=None, individuals=None, families=None ):
+    # Walk up through the parent families using a stack rather than recursion
+    # so that long lines and looped data can't exceed the recursion limit.
+    # The people are taken off the stack in the same order as a recursive walk.
+    # Each of the people is walked in turn, sharing what has been visited
+    # so that common ancestors are walked only once.
+    # If a boundary dict is given, the people stopped at the generation limit
+    # are put into it.
+    # The links default to the graph and the selection to the people and families
+    # for output, the indexed reader gives its own to find the records to read.
+    # Returns the number of links followed.
+
+    if links is None:
+       links = graph
+    if individuals is None:
+       individuals = the_individuals
+    if families is None:
+       families = the_families
+
+    famc = links.famc
+    husb = links.husb
+    wife = links.wife
+
+    n_links = 0
+
+    # generation distance of each person whose parents have been walked,
+    # a person is walked again only if reached by a shorter route
+    # which can matter when the number of generations is limited
+    closest = dict()
+    stack = []
+
+    def expand( person, depth ):
+        nonlocal n_links
+        closest[person] = depth
+        if generations is not None and depth >= generations:
+           if boundary is not None:
+              boundary[person] = depth
+           return
+        if boundary is not None:
+           # reached again by a shorter route
+           boundary.pop( person, None )
+        fam = famc[person]
+        if fam >= 0:
+           families.add( fam )
+           n_links += 1
+           # reversed so that the wife's line comes off the stack first
+           for parent_id in [ husb[fam], wife[fam] ]:
+               if parent_id >= 0:
+                  stack.append( (parent_id, depth + 1) )
+                  n_links += 1
+
+    for indi in people:
+        if indi in closest and closest[indi] == 0:
+           continue
+        expand( indi, 0 )
+
+        while stack:
+            person, depth = stack.pop()
+            individuals.add( person )
+            if person not in closest or depth < closest[person]:
+               expand( person, depth )
+
+    return n_links
+
+
+def add_descendents( people, generations=None, boundary=None, links=None, individuals=None, families=None ):
+    # Walk down through the families and children using a stack of tasks
+    # rather than recursion. The tasks are pushed in reverse so that they come
+    # off the stack in the same order as a recursive walk: each family, then its
+    # children and their lines, then the partner.
+    # The people, boundary, links and selection are the same as for the ancestors.
+    # Returns the number of links followed.
+
+    if links is None:
+       links = graph
+    if individuals is None:
+       individuals = the_individuals
+    if families is None:
+       families = the_families
+
+    n_links = 0
+
+    # same as for the ancestors
+    closest = dict()
+    stack = []
+
+    def expand( person, depth ):
+        closest[person] = depth
+        if generations is not None and depth >= generations:
+           if boundary is not None:
+              boundary[person] = depth
+           return
+        if boundary is not None:
+           boundary.pop( person, None )
+        for fam in reversed( links.families_of( person ) ):
+            stack.append( ('partner', fam, person) )
+            for child in reversed( links.children_of( fam ) ):
+                stack.append( ('child', child, depth + 1) )
+            stack.append( ('family', fam, None) )
+
+    for indi in people:
+        if indi in closest and closest[indi] == 0:
+           continue
+        expand( indi, 0 )
+
+        while stack:
+            task, item, extra = stack.pop()
+            n_links += 1
+
+            if task == 'family':
+               families.add( item )
+
+            elif task == 'child':
+               individuals.add( item )
+               if item not in closest or extra < closest[item]:
+                  expand( item, extra )
+
+            else:
+               # need to also add the partner in this family
+               # so that the family will be displayed
+               # but do not travel down this person's descendents
+               other = find_other_partner( extra, item, links )
+               if other is None:
+                  n_links -= 1
+               else:
+                  individuals.add( other )
+
+    return n_links
+
+
+def count_beyond( person, step ):
+    # Count the people not selected who are reached from the person
+    # by repeating the step, one generation at a time.
+    # Returns the number of people and of generations.
+
+    seen = set()
+    n_generations = 0
+
+    level = step( person )
+    while level:
+        next_level = []
+        found = False
+        for other in level:
+            if other not in seen and other not in the_individuals:
+               seen.add( other )
+               found = True
+               next_level.extend( step( other ) )
+        if found:
+           n_generations += 1
+        level = next_level
+
+    return len( seen ), n_generations
+
+
+def add_summaries( ancestor_boundary, descendent_boundary ):
+    # Each person at the edge of the detail gets a node standing in for
+    # the people beyond them who are not otherwise shown.
+    global the_summaries
+
+    for boundary, direction, step in [ (ancestor_boundary, 'ancestors', graph.parents_of),
+                                       (descendent_boundary, 'descendents', graph.all_children_of) ]:
+        for person in boundary:
+            n_people, n_generations = count_beyond( person, step )
+            if n_people > 0:
+               the_summaries.append( (person, direction, n_people, n_generations) )
+
+    print( 'Summarized the people beyond the detail in', len( the_summaries ), 'nodes', file=sys.stderr )
+
+
+def summary_label( direction, n_people, n_generations ):
+    people = str( n_people ) + ' people'
+    if n_people == 1:
+       people = '1 person'
+    generations = str( n_generations ) + ' generations'
+    if n_generations == 1:
+       generations = '1 generation'
+
+    if direction == 'ancestors':
+       return '+ ' + generations + ' of ancestors', '(' + people + ')'
+
+    descendents = str( n_people ) + ' descendents'
+    if n_people == 1:
+       descendents = '1 descendent'
+    return '+ ' + descendents, '(' + generations + ')'
+
+
+def path_neighbours( node ):
+    # The families are numbered after the people so that the search
+    # can treat both the same. A person leads to their parents' family
+    # and their own families, a family to the partners and children.
+    n_indi = graph.n_indi()
+    if node < n_indi:
+       results = [ n_indi + fam for fam in graph.families_of( node ) ]
+       if graph.famc[node] >= 0:
+          results.append( n_indi + graph.famc[node] )
+       return results
+    fam = node - n_indi
+    return graph.partners_of( fam ) + list( graph.children_of( fam ) )
 
 
-def add_ancestors( indi ):
+def add_path( start, end ):
+    # Select everyone on any of the shortest connections between the two people.
+    # The search goes out a generation at a time from both of them, each time
+    # from whichever side has fewer people to look at, until the sides meet.
+    # The level where they meet is finished so that every meeting point is found,
+    # then each side is walked back to its person through the nodes one step closer.
+    # Returns the number of links followed, or None if they are not connected.
+
     global the_individuals
     global the_families
 
-    if 'famc' in data[ikey][indi]:
-        fam = data[ikey][indi]['famc'][0]
-        if fam not in the_families:
-           the_families.append( fam )
-        for partner in ['wife','husb']:
-            if partner in data[fkey][fam]:
-               parent_id = data[fkey][fam][partner][0]
-               if parent_id not in the_individuals:
-                  the_individuals.append( parent_id )
-                  add_ancestors( parent_id )
+    links = 0
+
+    distance = [ {start:0}, {end:0} ]
+    frontier = [ [start], [end] ]
+
+    meet = []
+    if start == end:
+       meet.append( start )
+
+    while not meet and frontier[0] and frontier[1]:
+        side = 0
+        if len( frontier[1] ) < len( frontier[0] ):
+           side = 1
+        seen = distance[side]
+        other = distance[1 - side]
+
+        next_level = []
+        for node in frontier[side]:
+            for neighbour in path_neighbours( node ):
+                links += 1
+                if neighbour not in seen:
+                   seen[neighbour] = seen[node] + 1
+                   next_level.append( neighbour )
+                   if neighbour in other:
+                      meet.append( neighbour )
+        frontier[side] = next_level
+
+    if not meet:
+       return None
+
+    length = distance[0][meet[0]] + distance[1][meet[0]]
+
+    on_path = set( meet )
+    for side in [0, 1]:
+        steps = distance[side]
+        level = meet
+        while level:
+            next_level = []
+            for node in level:
+                for neighbour in path_neighbours( node ):
+                    links += 1
+                    if neighbour not in on_path and steps.get( neighbour ) == steps[node] - 1:
+                       on_path.add( neighbour )
+                       next_level.append( neighbour )
+            level = next_level
+
+    # in order of distance from the first person, and count the connections on the way
+    def steps_from_start( node ):
+        if node in distance[0]:
+           return distance[0][node]
+        return length - distance[1][node]
+
+    ordered = sorted( on_path, key=lambda node: ( steps_from_start( node ), node ) )
+
+    n_paths = { start:1 }
+    for node in ordered:
+        for neighbour in path_neighbours( node ):
+            if neighbour in on_path and steps_from_start( neighbour ) == steps_from_start( node ) + 1:
+               n_paths[neighbour] = n_paths.get( neighbour, 0 ) + n_paths[node]
+
+    n_indi = graph.n_indi()
+    for node in ordered:
+        if node < n_indi:
+           the_individuals.add( node )
+        else:
+           the_families.add( node - n_indi )
+
+    print( 'Found', n_paths[end], 'shortest connections through', length // 2, 'families', file=sys.stderr )
 
+    return links
 
-def add_descendents( indi ):
-    global the_individuals
-    global the_families
 
-    if 'fams' in data[ikey][indi]:
-       for fam in data[ikey][indi]['fams']:
-           if fam not in the_families:
-              the_families.append( fam )
-           if 'chil' in data[fkey][fam]:
-              for child in data[fkey][fam]['chil']:
-                  if child not in the_individuals:
-                     the_individuals.append( child )
-                     add_descendents( child )
-           # need to also add the partner in this family
-           # so that the family will be displayed
-           # but do not travel down this person's descendents
-           other = find_other_partner( indi, fam )
-           if other is not None:
-              the_individuals.append( other )
-
-
-def get_individuals( who_to_include, the_person ):
+def get_individuals( who_to_include, the_people, generations=None, detail=None ):
+    # The people are the starting points, all walked together.
+    # With detail, the walk stops at that many generations
+    # and the people beyond are counted into summaries.
+
     global the_individuals
     global the_families
 
     result = True
+    links = 0
+
+    ancestor_boundary = None
+    descendent_boundary = None
+    if detail is not None:
+       generations = detail
+       ancestor_boundary = dict()
+       descendent_boundary = dict()
 
     if who_to_include == 'all':
-       for indi in data[ikey]:
-           the_individuals.append( indi )
-       for fam in data[fkey]:
-           the_families.append( fam )
+       for indi in range( graph.n_indi() ):
+           the_individuals.add( indi )
+       for fam in range( graph.n_fam() ):
+           the_families.add( fam )
 
     else:
        # the existance of a personid value should already have been checked
 
-       print( 'Selected person', the_person, '=', get_name(the_person, 'display'), file=sys.stderr )
-       the_individuals.append( the_person )
+       for the_person in the_people:
+           print( 'Selected person', graph.indi_keys[the_person], '=', get_name(the_person, 'display'), file=sys.stderr )
+           the_individuals.add( the_person )
 
        if who_to_include == 'ancestors':
           print( 'Output ancestors', file=sys.stderr )
-          add_ancestors( the_person )
+          links += add_ancestors( the_people, generations, ancestor_boundary )
 
        elif who_to_include == 'descendents':
           print( 'Output descendents', file=sys.stderr )
-          add_descendents( the_person )
+          links += add_descendents( the_people, generations, descendent_boundary )
 
        elif who_to_include == 'branch':
           print( 'Output ancestors and descendents', file=sys.stderr )
-          add_ancestors( the_person )
-          add_descendents( the_person )
+          links += add_ancestors( the_people, generations, ancestor_boundary )
+          links += add_descendents( the_people, generations, descendent_boundary )
+
+       elif who_to_include == 'path':
+          print( 'Output the shortest connections between them', file=sys.stderr )
+          path_links = add_path( the_people[0], the_people[1] )
+          if path_links is None:
+             print( 'The two people are not connected', file=sys.stderr )
+             result = False
+          else:
+             links += path_links
 
        else:
           # unlikley to get here, but just in case i've made a typo
           print( 'Unknown option for include:', who_to_include, file=sys.stderr )
           result = False
 
-    return result
+       if result:
+          print( 'Visited', len( the_individuals ), 'people and', len( the_families ), 'families',
+                 'through', links, 'links', file=sys.stderr )
 
+          if detail is not None:
+             add_summaries( ancestor_boundary, descendent_boundary )
 
-def json_ancestors( indi ):
-    results = dict()
-    if indi in the_individuals:
-       results[indi] = dict()
-       results[indi]['name'] = get_name_json( indi )
-       # they get a parent list, but it might be empty
-       results[indi]['child_of'] = dict()
-       if 'famc' in data[ikey][indi]:
-          fam = data[ikey][indi]['famc'][0]
-
-          results[indi]['child_of']['id'] = fam
-          results[indi]['child_of']['parents'] = []
-          # potentially add a marriage date here too
+    return result
 
-          for parent in ['wife','husb']:
-              if parent in data[fkey][fam]:
-                 parent_id = data[fkey][fam][parent][0]
-                 results[indi]['child_of']['parents'].append( json_ancestors( parent_id ) )
 
-    return results
+def find_components():
+    # Group the people who are connected through families,
+    # using union-find over the person numbers.
+    # Returns lists of the people and of the families in each group,
+    # largest group first and each list in data order.
+    # A family with nobody in it is not in any group.
+
+    n_indi = graph.n_indi()
+    parent = array( 'i', range( n_indi ) )
+    size = array( 'i', [1] ) * n_indi
+
+    def find( indi ):
+        while parent[indi] != indi:
+            # halve the path on the way up so later finds are shorter
+            parent[indi] = parent[parent[indi]]
+            indi = parent[indi]
+        return indi
+
+    for fam in range( graph.n_fam() ):
+        members = graph.partners_of( fam ) + list( graph.children_of( fam ) )
+        first = find( members[0] ) if members else -1
+        for other in members[1:]:
+            other = find( other )
+            if other != first:
+               # the smaller group joins the larger
+               if size[first] < size[other]:
+                  first, other = other, first
+               parent[other] = first
+               size[first] += size[other]
+
+    group_of = dict()
+    people = []
+    for indi in range( n_indi ):
+        root = find( indi )
+        if root not in group_of:
+           group_of[root] = len( people )
+           people.append( [] )
+        people[group_of[root]].append( indi )
+
+    families = [ [] for group in people ]
+    for fam in range( graph.n_fam() ):
+        members = graph.partners_of( fam ) or graph.children_of( fam )
+        if members:
+           families[group_of[find( members[0] )]].append( fam )
+
+    # sorting is stable so equal sizes stay in the order of their first person
+    order = sorted( range( len( people ) ), key=lambda group: -len( people[group] ) )
+
+    return [ people[group] for group in order ], [ families[group] for group in order ]
+
+
+def load_components():
+    global component_people
+    global component_families
+
+    with stats_phase( 'find components' ):
+         component_people, component_families = find_components()
+
+    add_stats_count( 'connected groups', len( component_people ) )
+
+
+def select_component( n ):
+    global the_individuals
+    global the_families
 
+    for indi in component_people[n]:
+        the_individuals.add( indi )
+    for fam in component_families[n]:
+        the_families.add( fam )
+
+    print( 'Group', n + 1, 'has', len( the_individuals ), 'people and', len( the_families ), 'families', file=sys.stderr )
+
+    return True
+
+
+def split_jobs( program_options ):
+    # One job for each group of connected people within the size limits,
+    # and an index file listing them in the output directory.
+    # Returns the list of jobs, or None if the index can't be written.
+
+    out_dir = program_options['split']
+    min_size = program_options['min-size']
+    max_size = program_options['max-size']
+
+    ending = SPLIT_EXTENSIONS[program_options['format']]
+    if program_options['compress']:
+       ending += COMPRESS_EXTENSIONS[program_options['compress']]
+
+    jobs = []
+    outputs = []
+
+    for n, people in enumerate( component_people ):
+        if len( people ) < min_size:
+           # the rest are no larger
+           break
+        if max_size is not None and len( people ) > max_size:
+           continue
+
+        # numbered by size among all the groups, so the name of a group
+        # doesn't depend on the limits
+        file_name = 'component-%05d%s' % ( n + 1, ending )
+
+        job = dict( program_options )
+        job['component'] = n
+        job['output'] = os.path.join( out_dir, file_name )
+        jobs.append( job )
+
+        output = dict()
+        output['file'] = file_name
+        output['people'] = len( people )
+        output['families'] = len( component_families[n] )
+        output['first'] = indi_xref( people[0] ).replace( '@', '' )
+        output['name'] = get_name( people[0], 'display' )
+        outputs.append( output )
+
+    index = dict()
+    index['gedcom'] = os.path.basename( program_options['infile'] )
+    index['format'] = program_options['format']
+    index['groups'] = len( component_people )
+    index['min-size'] = min_size
+    index['max-size'] = max_size
+    index['outputs'] = outputs
+
+    index_name = os.path.join( out_dir, SPLIT_INDEX )
+    try:
+       os.makedirs( out_dir, exist_ok=True )
+       with open( index_name, 'w', encoding='utf-8' ) as f:
+            json.dump( index, f, indent=1 )
+
+    except OSError as e:
+       print( 'Unable to write index', index_name, ':', e, file=sys.stderr )
+       return None
+
+    print( 'Found', len( component_people ), 'groups of connected people, writing', len( jobs ),
+           'to', out_dir, file=sys.stderr )
+
+    return jobs
+
+
+def json_ref( writer, indi ):
+    writer.begin( '{' )
+    writer.key( 'ref' )
+    writer.value( graph.indi_keys[indi] )
+    writer.end( '}' )
+
+
+def json_family( writer, fam, indi, stack ):
+    # one of the families of a person in the descendents tree
+    other = find_other_partner( indi, fam )
+
+    writer.begin( '{' )
+    # potentially add a marriage date here too
+    writer.key( 'id' )
+    writer.value( graph.fam_keys[fam] )
+    writer.key( 'with_id' )
+    if other is None:
+       writer.value( None )
+    else:
+       writer.value( graph.indi_keys[other] )
+    writer.key( 'with_name' )
+    writer.value( get_name_json( other ) )
+    # they get a child list, but it might be empty
+    writer.key( 'children' )
+    writer.begin( '[' )
+
+    stack.append( ('end', '}') )
+    stack.append( ('end', ']') )
+    for child in reversed( graph.children_of( fam ) ):
+        stack.append( ('person', child, indi) )
+
+
+def json_person( writer, indi, ancestors, stack ):
+    # The start of a person's tree. What follows is put on the stack
+    # in reverse order: their parents or their families, then the closing brackets.
+    indi_id = graph.indi_keys[indi]
+
+    writer.begin( '{' )
+    writer.key( indi_id )
+    writer.begin( '{' )
+    writer.key( 'name' )
+    writer.value( get_name_json( indi ) )
+
+    stack.append( ('end', '}') )
+    stack.append( ('end', '}') )
+
+    if ancestors:
+       # they get a parent list, but it might be empty
+       writer.key( 'child_of' )
+       writer.begin( '{' )
+       stack.append( ('end', '}') )
+       fam = graph.famc[indi]
+       if fam >= 0:
+          writer.key( 'id' )
+          writer.value( graph.fam_keys[fam] )
+          # potentially add a marriage date here too
+          writer.key( 'parents' )
+          writer.begin( '[' )
+          stack.append( ('end', ']') )
+          for parent_id in reversed( graph.partners_of( fam ) ):
+              stack.append( ('person', parent_id, indi) )
 
-def json_descendents( indi ):
-    results = dict()
-    if indi in the_individuals:
-       results[indi] = dict()
-       results[indi]['name'] = get_name_json( indi )
+    else:
        # they get a family, but it might be empty
-       results[indi]['families'] = []
-       if 'fams' in data[ikey][indi]:
-          for fam in data[ikey][indi]['fams']:
-              other = find_other_partner( indi, fam )
-
-              fam_info = dict()
-              # potentially add a marriage date here too
-              fam_info['id'] = fam
-              fam_info['with_id'] = other
-              fam_info['with_name'] = get_name_json( other )
-              # they get a child list, but it might be empty
-              fam_info['children'] = []
-
-              if 'chil' in data[fkey][fam]:
-                 for child in data[fkey][fam]['chil']:
-                     fam_info['children'].append( json_descendents( child ) )
-
-              results[indi]['families'].append( fam_info )
-    return results
+       writer.key( 'families' )
+       writer.begin( '[' )
+       stack.append( ('end', ']') )
+       for fam in reversed( graph.families_of( indi ) ):
+           stack.append( ('family', fam, indi) )
 
 
 def output_json( the_person ):
-    output = dict()
+    # The tree is written as it is walked, using a stack rather than recursion,
+    # so the output itself is never held: only the stack of relatives still to write
+    # and the people whose trees are being output, so memory grows with the depth of the tree.
+    #
+    # A person reached more than once, as with cousin marriages, is either output
+    # again in full or as a reference. Only references need the people already output,
+    # so those are kept only with the refs option. A loop in the data is always a reference,
+    # and is remembered so that the same reference is in any repeat of the tree around it.
+    # Returns the number of people output in full.
 
     # the contents are slightly different depending on the direction
-    if options['include'] == 'ancestors':
-       output = json_ancestors( the_person )
+    ancestors = options['include'] == 'ancestors'
+    keep_done = options['refs']
+
+    writer = JsonWriter( sink, options['compact'] )
+
+    # the people being output: None while their tree is being output,
+    # and True once it is complete if they are kept for references
+    known = dict()
+    loop_refs = set()
+    n_output = 0
+
+    stack = [ ('person', the_person, None) ]
+    while stack:
+        item = stack.pop()
+        kind = item[0]
+
+        if kind == 'end':
+           writer.end( item[1] )
+
+        elif kind == 'done':
+           if keep_done:
+              known[item[1]] = True
+           else:
+              del known[item[1]]
+
+        elif kind == 'family':
+           json_family( writer, item[1], item[2], stack )
+
+        else:
+           indi = item[1]
+           via = item[2]
+           if indi not in the_individuals:
+              writer.begin( '{' )
+              writer.end( '}' )
+           elif ( via, indi ) in loop_refs:
+              json_ref( writer, indi )
+           elif indi in known and known[indi] is None:
+              loop_refs.add( ( via, indi ) )
+              json_ref( writer, indi )
+           elif indi in known:
+              json_ref( writer, indi )
+           else:
+              known[indi] = None
+              stack.append( ('done', indi) )
+              n_output += 1
+              json_person( writer, indi, ancestors, stack )
+
+    return n_output
+
+
+def cyjs_node( writer, node_id, kind, color, label, position ):
+    writer.begin( '{' )
+    writer.key( 'data' )
+    writer.begin( '{' )
+    writer.key( 'id' )
+    writer.value( node_id )
+    writer.key( 'label' )
+    writer.value( label )
+    writer.key( 'type' )
+    writer.value( kind )
+    writer.key( 'color' )
+    writer.value( color )
+    writer.end( '}' )
+    if position:
+       writer.key( 'position' )
+       writer.begin( '{' )
+       writer.key( 'x' )
+       writer.value( position[0] )
+       writer.key( 'y' )
+       writer.value( position[1] )
+       writer.end( '}' )
+    writer.end( '}' )
+
+
+def cyjs_edge( writer, n, source, target, kind, color ):
+    writer.begin( '{' )
+    writer.key( 'data' )
+    writer.begin( '{' )
+    writer.key( 'id' )
+    writer.value( 'e' + str( n ) )
+    writer.key( 'source' )
+    writer.value( source )
+    writer.key( 'target' )
+    writer.value( target )
+    writer.key( 'type' )
+    writer.value( kind )
+    writer.key( 'color' )
+    writer.value( color )
+    writer.end( '}' )
+    writer.end( '}' )
+
+
+def flat_nodes( name_style, positions ):
+    # The nodes in the same order as graphml: the people, the unions, then the summaries.
+    # Each is the id, type, colour, label and position, which is None without a layout.
+    n = 0
+    for indi in the_individuals:
+        position = None
+        if positions:
+           position = positions[n]
+        yield graph.indi_keys[indi], 'person', NAME_COLOR, get_name( indi, name_style ), position
+        n += 1
+    for fam in the_families:
+        position = None
+        if positions:
+           position = positions[n]
+        # potentially a marriage date could be used as the label
+        yield graph.fam_keys[fam], 'union', UNION_COLOR, UNION_LABEL, position
+        n += 1
+    for i, summary in enumerate( the_summaries ):
+        position = None
+        if positions:
+           position = positions[n]
+        yield make_dot_stag( i ), 'summary', SUMMARY_COLOR, ' '.join( summary_label( summary[1], summary[2], summary[3] ) ), position
+        n += 1
+
+
+def flat_edges():
+    # The same links as graphml, each as the source id, target id, type and colour.
+    for fam in the_families:
+        fam_id = graph.fam_keys[fam]
+        for child in graph.children_of( fam ):
+            if child in the_individuals:
+               yield fam_id, graph.indi_keys[child], 'child', CHILD_CONNECT
+        for parent_id in [ graph.husb[fam], graph.wife[fam] ]:
+            if parent_id in the_individuals:
+               yield graph.indi_keys[parent_id], fam_id, 'parent', PARENT_CONNECT
+    # the ancestors are the source as if they were the parent union
+    for i, summary in enumerate( the_summaries ):
+        if summary[1] == 'ancestors':
+           yield make_dot_stag( i ), graph.indi_keys[summary[0]], 'child', CHILD_CONNECT
+        else:
+           yield graph.indi_keys[summary[0]], make_dot_stag( i ), 'parent', PARENT_CONNECT
+
+
+def output_cyjs( reverse_links, layout ):
+    # The Cytoscape elements as flat lists of nodes and edges,
+    # the same nodes and links as the graphml, with the data keys as ids.
+    # Written as it goes, so it can be used for the whole tree.
+    # Returns the number of nodes and the number of edges.
+
+    positions = None
+    if layout:
+       positions = graphml_positions( reverse_links )
+
+    writer = JsonWriter( sink, options['compact'] )
+
+    writer.begin( '{' )
+    writer.key( 'elements' )
+    writer.begin( '{' )
+
+    writer.key( 'nodes' )
+    writer.begin( '[' )
+    n_nodes = 0
+    for node_id, kind, color, label, position in flat_nodes( 'display', positions ):
+        cyjs_node( writer, node_id, kind, color, label, position )
+        n_nodes += 1
+    writer.end( ']' )
+
+    writer.key( 'edges' )
+    writer.begin( '[' )
+    n_edges = 0
+    for source, target, kind, color in flat_edges():
+        n_edges += 1
+        cyjs_edge( writer, n_edges, source, target, kind, color )
+    writer.end( ']' )
+
+    writer.end( '}' )
+    writer.end( '}' )
+
+    return n_nodes, n_edges
+
 
+def output_sif():
+    # Simple interaction format, a tab separated line for each link:
+    # source, type of link, target. A node without any links is a line of its own.
+    # Returns the number of nodes and the number of edges.
+
+    writer = csv.writer( sink, delimiter='\t', lineterminator='\n' )
+
+    linked = set()
+    n_edges = 0
+    for source, target, kind, color in flat_edges():
+        writer.writerow( (source, kind, target) )
+        linked.add( source )
+        linked.add( target )
+        n_edges += 1
+
+    n_nodes = 0
+    unlinked = []
+    for node_id, kind, color, label, position in flat_nodes( 'display', None ):
+        n_nodes += 1
+        if node_id not in linked:
+           unlinked.append( (node_id,) )
+    writer.writerows( unlinked )
+
+    return n_nodes, n_edges
+
+
+def csv_edges_name( file_name ):
+    # The edges go next to the nodes file, "family.csv.gz" has "family-edges.csv.gz"
+    ending = ''
+    for extension in COMPRESS_EXTENSIONS.values():
+        if file_name.endswith( extension ):
+           ending = extension
+           file_name = file_name[:-len( extension )]
+    if file_name.lower().endswith( '.csv' ):
+       ending = file_name[-4:] + ending
+       file_name = file_name[:-4]
+    return file_name + '-edges' + ending
+
+
+def output_csv( reverse_links, layout ):
+    # A table of nodes and a table of edges, with the same nodes and links as graphml.
+    # The edges go to their own file when there is one, otherwise they follow
+    # the nodes after an empty line.
+    # Returns the number of nodes and the number of edges.
+
+    positions = None
+    if layout:
+       positions = graphml_positions( reverse_links )
+
+    header = ['id', 'label', 'type', 'color']
+    if positions:
+       header.extend( ['x', 'y'] )
+
+    # the rows are written as they are made, and counted on the way
+    counts = dict()
+
+    def counted( name, rows ):
+        counts[name] = 0
+        for row in rows:
+            counts[name] += 1
+            yield row
+
+    def node_rows():
+        for node_id, kind, color, label, position in flat_nodes( 'display', positions ):
+            row = [node_id, label, kind, color]
+            if position:
+               row.extend( position )
+            yield row
+
+    writer = csv.writer( sink, lineterminator='\n' )
+    writer.writerow( header )
+    writer.writerows( counted( 'nodes', node_rows() ) )
+
+    if edge_sink:
+       writer = csv.writer( edge_sink, lineterminator='\n' )
     else:
-       output = json_descendents( the_person )
+       sink.write( '\n' )
 
-    json.dump( output, indent=1, fp=sys.stdout )
+    writer.writerow( ['source', 'target', 'type', 'color'] )
+    writer.writerows( counted( 'edges', flat_edges() ) )
 
+    return counts['nodes'], counts['edges']
 
-def output_data( out_format, reverse_links, thickness, use_color, picked_person ):
+
+def output_data( out_format, reverse_links, thickness, use_color, picked_person, layout=False ):
     result = True
 
     # put each person into a node
     # and each family also
     n_nodes = 0
+    n_edges = 0
 
     # by creating a new list
     indi_nodes = dict()
     fam_nodes = dict()
+    summary_nodes = dict()
 
     if out_format == 'graphml':
+       positions = None
+       if layout:
+          positions = graphml_positions( reverse_links )
+
        graphml_header()
-       graphml_setup()
+       graphml_setup( layout )
        begin_graphml()
 
-       n_nodes = graphml_names( n_nodes, indi_nodes )
-       n_nodes = graphml_unions( n_nodes, fam_nodes )
-       graphml_connectors( indi_nodes, fam_nodes )
+       n_nodes = graphml_names( n_nodes, indi_nodes, positions )
+       n_nodes = graphml_unions( n_nodes, fam_nodes, positions )
+       n_nodes = graphml_summaries( n_nodes, summary_nodes, positions )
+       n_edges = graphml_connectors( indi_nodes, fam_nodes )
+       n_edges = graphml_summary_connectors( n_edges, indi_nodes, summary_nodes )
 
        end_graphml()
        graphml_trailer()
@@ -641,21 +2971,180 @@ def output_data( out_format, reverse_links, thickness, use_color, picked_person
 
        n_nodes = dot_families( style2, n_nodes, indi_nodes, fam_nodes )
        n_nodes = dot_not_families( n_nodes, indi_nodes )
-       dot_connectors( indi_nodes, fam_nodes, reverse_links, use_color )
+       n_nodes = dot_summaries( n_nodes, summary_nodes )
+       n_edges = dot_connectors( indi_nodes, fam_nodes, reverse_links, use_color )
+       n_edges += dot_summary_connectors( indi_nodes, summary_nodes, reverse_links )
+
+       if layout:
+          dot_positions( indi_nodes, fam_nodes, summary_nodes, reverse_links )
 
        dot_trailer()
 
     elif out_format == 'json':
-       output_json( picked_person )
+       n_nodes = output_json( picked_person )
+
+    elif out_format == 'cyjs':
+       n_nodes, n_edges = output_cyjs( reverse_links, layout )
+
+    elif out_format == 'sif':
+       n_nodes, n_edges = output_sif()
+
+    elif out_format == 'csv':
+       n_nodes, n_edges = output_csv( reverse_links, layout )
 
     else:
        # unlikely to get here, but just in case i've made a typo
        print( 'Unknown format', out_format, file=sys.stderr )
        result = False
 
+    add_stats_count( 'output nodes', n_nodes )
+    add_stats_count( 'output edges', n_edges )
+
+    return result
+
+
+def write_output( file_name, compression, use_color, picked_person, stream=None ):
+    # Output to the file, or to the given text stream.
+    # Returns True if successful.
+    global sink
+    global edge_sink
+
+    result = False
+
+    if stream is None:
+       sink = open_output( file_name, compression, options['buffer'] )
+    else:
+       sink = OutputSink( stream, options['buffer'] )
+
+    # csv edges have their own file alongside an output file
+    edge_sink = None
+    if sink and file_name and stream is None and options['format'] == 'csv':
+       edge_sink = open_output( csv_edges_name( file_name ), compression, options['buffer'] )
+       if not edge_sink:
+          sink.close()
+          sink = None
+
+    if sink:
+       result = output_data( options['format'], options['reverse'], options['thick'], use_color, picked_person,
+                             options['layout'] )
+       sink.close()
+       sink = None
+       if edge_sink:
+          edge_sink.close()
+          edge_sink = None
+
     return result
 
 
+def record_text( section, key ):
+    # The gedcom lines of a person or family record and everything under it,
+    # without the line numbers so that moving a record in the file is not a change.
+    file_record = data[section][key]['file_record']
+    record = data[file_record['key']][file_record['index']]
+
+    if 'sub' not in record:
+       # the lean reader doesn't keep the lines, only the values it uses
+       parsed = data[section][key]
+       return repr( [ (item, parsed[item]) for item in parsed if item != 'file_record' ] )
+
+    lines = []
+    stack = [ (0, record) ]
+    while stack:
+        level, item = stack.pop()
+        lines.append( '%d %s %s\n' % ( level, item.get( 'tag', '' ), item.get( 'value', '' ) ) )
+        for sub in reversed( item.get( 'sub', [] ) ):
+            stack.append( (level + 1, sub) )
+
+    return ''.join( lines )
+
+
+def render_fingerprint( compression, use_color, picked_person ):
+    # A hash of everything which goes into an output.
+    # People and families are identified by their data keys rather than
+    # their numbers, which change when records are added before them.
+
+    settings = [ get_version(), reader_key(), compression ]
+    settings.extend( [ options[name] for name in RENDER_OPTIONS ] )
+    if picked_person is not None:
+       settings.append( graph.indi_keys[picked_person] )
+    settings.append( len( the_individuals ) )
+    settings.append( len( the_families ) )
+    settings.append( sorted( [ (graph.fam_keys[fam], use_color[fam]) for fam in use_color ] ) )
+    settings.append( [ (graph.indi_keys[summary[0]],) + summary[1:] for summary in the_summaries ] )
+
+    h = hashlib.sha256( repr( settings ).encode( 'utf-8' ) )
+    for indi in the_individuals:
+        h.update( record_text( ikey, graph.indi_keys[indi] ).encode( 'utf-8' ) )
+    for fam in the_families:
+        h.update( record_text( fkey, graph.fam_keys[fam] ).encode( 'utf-8' ) )
+        # the dot formats show both partners of a family, even one who isn't selected
+        for partner in graph.partners_of( fam ):
+            if partner not in the_individuals:
+               h.update( record_text( ikey, graph.indi_keys[partner] ).encode( 'utf-8' ) )
+
+    return h.hexdigest()
+
+
+def render_output( use_color, picked_person ):
+    # Output through the render cache. Each output is saved under the fingerprint
+    # of its inputs, so an output whose records and options have not changed is
+    # copied from the cache rather than made again. An output file which already
+    # matches is left alone so that its time doesn't trigger later steps.
+    # Returns True if successful.
+
+    cache_dir = options['render-cache']
+    target = options['output']
+    compression = output_compression( target, options['compress'] )
+
+    fingerprint = render_fingerprint( compression, use_color, picked_person )
+    cache_name = os.path.join( cache_dir, fingerprint + RENDER_SUFFIX )
+
+    what = target
+    if what is None:
+       what = 'stdout'
+
+    if os.path.isfile( cache_name ):
+       print( 'Reused saved output for', what, file=sys.stderr )
+       add_stats_count( 'outputs reused', 1 )
+
+    else:
+       # written to a temporary name so that a partial output is never used
+       temp_name = cache_name + '.' + str( os.getpid() )
+       try:
+          os.makedirs( cache_dir, exist_ok=True )
+       except OSError as e:
+          print( 'Unable to make render cache', cache_dir, ':', e, file=sys.stderr )
+          return False
+
+       if not write_output( temp_name, compression, use_color, picked_person ):
+          if os.path.isfile( temp_name ):
+             os.remove( temp_name )
+          return False
+       os.replace( temp_name, cache_name )
+
+       print( 'Rebuilt output for', what, file=sys.stderr )
+       add_stats_count( 'outputs rebuilt', 1 )
+
+    try:
+       if target is None:
+          sys.stdout.flush()
+          with open( cache_name, 'rb' ) as f:
+               shutil.copyfileobj( f, sys.stdout.buffer )
+          sys.stdout.buffer.flush()
+
+       elif os.path.isfile( target ) and filecmp.cmp( cache_name, target, shallow=False ):
+          print( 'Output file is unchanged', target, file=sys.stderr )
+
+       else:
+          shutil.copyfile( cache_name, target )
+
+    except OSError as e:
+       print( 'Unable to write output', what, ':', e, file=sys.stderr )
+       return False
+
+    return True
+
+
 def data_ok():
     result = False
     # it is possible to have a tree with no families,
@@ -674,7 +3163,7 @@ def options_ok( program_options ):
     result = True
 
     if program_options['format'] == 'json':
-       exclude = ['all','branch']
+       exclude = ['all','branch','path']
        if program_options['include'] in exclude:
           print( 'JSON format is not compatible with including one of', exclude, file=sys.stderr )
           result = False
@@ -683,32 +3172,134 @@ def options_ok( program_options ):
        if program_options['personid'] is None:
           print( 'include other than "all" requires a personid', file=sys.stderr )
           result = False
+       elif not person_ids( program_options['personid'] ):
+          print( 'personid does not contain any ids', file=sys.stderr )
+          result = False
+       elif program_options['format'] == 'json' and len( person_ids( program_options['personid'] ) ) > 1:
+          print( 'JSON format is a tree from one person, only one personid can be used', file=sys.stderr )
+          result = False
 
-    return result
+    if program_options['include'] == 'path':
+       if program_options['personid'] is not None and len( person_ids( program_options['personid'] ) ) != 2:
+          print( 'include "path" requires two people in personid', file=sys.stderr )
+          result = False
+       if program_options['generations'] is not None or program_options['detail'] is not None:
+          print( 'generations and detail can not be used with a path', file=sys.stderr )
+          result = False
 
+    if program_options['color-roots']:
+       if program_options['color-tree']:
+          print( 'Choose only one of colouring and colour-roots', file=sys.stderr )
+          result = False
+       if program_options['include'] == 'all':
+          print( 'colour-roots requires an include other than "all"', file=sys.stderr )
+          result = False
 
-def find_color_people( tag, include, out_format, selected_tops ):
-    results = dict()
+    if program_options['buffer'] < 1:
+       print( 'buffer size must be at least 1', file=sys.stderr )
+       result = False
 
-    # prevent loops
-    fam_is_set = []
+    if program_options['jobs'] < 1:
+       print( 'jobs must be at least 1', file=sys.stderr )
+       result = False
 
-    def set_color_descendants( p, color ):
-        if 'fams' in data[ikey][p]:
-           for fam in data[ikey][p]['fams']:
-               if fam not in fam_is_set:
-                  fam_is_set.append( fam )
-                  results[fam] = color
-                  if 'chil' in data[fkey][fam]:
-                     for child in data[fkey][fam]['chil']:
-                         set_color_descendants( child, color )
+    if program_options['generations'] is not None:
+       if program_options['generations'] < 0:
+          print( 'generations can not be negative', file=sys.stderr )
+          result = False
 
+    if program_options['detail'] is not None:
+       if program_options['detail'] < 0:
+          print( 'detail can not be negative', file=sys.stderr )
+          result = False
+       if program_options['generations'] is not None:
+          print( 'Choose only one of generations and detail', file=sys.stderr )
+          result = False
+       if program_options['include'] == 'all':
+          print( 'detail requires an include other than "all"', file=sys.stderr )
+          result = False
+       if program_options['format'] == 'json':
+          print( 'detail is not available for json format, use generations', file=sys.stderr )
+          result = False
+
+    if program_options['reader'] == 'lean':
+       if program_options['iditem'] != 'xref' and not re.match( r'^[a-z0-9_]+$', program_options['iditem'] ):
+          print( 'The lean reader can find people only by xref or a single tag, not', program_options['iditem'], file=sys.stderr )
+          result = False
+
+    if program_options['reader'] == 'indexed':
+       if program_options['iditem'] != 'xref':
+          print( 'The indexed reader can find people only by xref', file=sys.stderr )
+          result = False
+
+    if program_options['color-precedence'] not in COLOR_PRECEDENCE:
+       print( 'colour precedence should be one of', COLOR_PRECEDENCE, file=sys.stderr )
+       result = False
+
+    if program_options['compact']:
+       if program_options['format'] not in ['json', 'cyjs']:
+          print( 'compact is only for json and cyjs formats', file=sys.stderr )
+          result = False
+
+    if program_options['layout']:
+       if program_options['format'] in ['json', 'sif']:
+          print( 'layout is not available for json and sif formats', file=sys.stderr )
+          result = False
+
+    if program_options['format'] == 'csv' and program_options['render-cache']:
+       print( 'csv format writes two files, which the render cache can not save', file=sys.stderr )
+       result = False
+
+    if program_options['serve'] is not None:
+       if program_options['serve'] < 0 or program_options['serve'] > 65535:
+          print( 'serve needs a port number from 0 to 65535', file=sys.stderr )
+          result = False
+       for name in ['batch', 'split', 'output']:
+           if program_options[name]:
+              print( 'serve replies to each request, it can not be used with', name, file=sys.stderr )
+              result = False
+
+    if program_options['split']:
+       if program_options['include'] != 'all':
+          print( 'split requires include "all"', file=sys.stderr )
+          result = False
+       if program_options['format'] not in SPLIT_EXTENSIONS:
+          print( 'split is only for formats', list( SPLIT_EXTENSIONS ), file=sys.stderr )
+          result = False
+       if program_options['batch']:
+          print( 'Choose only one of batch and split', file=sys.stderr )
+          result = False
+       if program_options['output']:
+          print( 'split names its own output files, output can not be used', file=sys.stderr )
+          result = False
+       if program_options['min-size'] < 1:
+          print( 'min-size must be at least 1', file=sys.stderr )
+          result = False
+       if program_options['max-size'] is not None:
+          if program_options['max-size'] < program_options['min-size']:
+             print( 'max-size can not be less than min-size', file=sys.stderr )
+             result = False
+
+    return result
+
+
+def find_color_people( tag, include, out_format, selected_tops, precedence=COLOR_PRECEDENCE[0], for_roots=False ):
+    # Colour the lines to the descendents of each of the selected people.
+    # When a family descends from more than one of them, the precedence decides:
+    # "order" gives it to the last in the list and "youngest" to the nearest
+    # in generations, then the last in the list.
+    # Every family is visited at most once, whatever the number of people.
+    # The people the output starts from are coloured with any include,
+    # as their descendents may be different lines.
+    # Returns the colour of each family.
+
+    results = dict()
 
     if not selected_tops:
        return results
     if out_format not in ['dot','dot2']:
        return results
-    if include.startswith('desc'):
+    if include.startswith('desc') and not for_roots:
        return results
 
     # the selected people are parents, but we need to find all the
@@ -716,7 +3307,7 @@ def find_color_people( tag, include, out_format, selected_tops ):
 
     # first get the xref of the selected parents
 
-    search_for = selected_tops.split(',')
+    search_for = person_ids( selected_tops )
     parents = []
     for indi in search_for:
         found_id = find_person( indi, tag )
@@ -726,56 +3317,425 @@ def find_color_people( tag, include, out_format, selected_tops ):
         else:
            print( 'Warning: did\'t find person for coloured lines', indi, 'using tag', tag, file=sys.stderr )
 
-    if parents:
-       i_color = 0
-       n_color = len( line_colors )
-       for indi in parents:
-           if i_color == n_color:
-              i_color = 0
+    if not parents:
+       return results
+
+    colors = []
+    for i in range( len( parents ) ):
+        colors.append( line_colors[i % len( line_colors )] )
+
+    # the later people in the list come first so that they claim the shared families
+    sources = list( zip( parents, colors ) )
+    sources.reverse()
+
+    if precedence == 'youngest':
+       # one generation at a time from all the people together,
+       # so a family is claimed by the nearest
+       level = sources
+       while level:
+           next_level = []
+           for indi, color in level:
+               for fam in graph.families_of( indi ):
+                   if fam not in results:
+                      results[fam] = color
+                      for child in graph.children_of( fam ):
+                          next_level.append( (child, color) )
+           level = next_level
 
-           # all descandants get the same color
-           # unless another parent color from another family replaces it
-           # so if a family was coloured it can be re-coloured
-           fam_is_set = []
-           set_color_descendants( indi, line_colors[i_color] )
+    else:
+       # Everything below a family claimed by a later person in the list
+       # also descends from them and so has been claimed already,
+       # there is no need to go further down.
+       for indi, color in sources:
+           stack = [indi]
+           while stack:
+               person = stack.pop()
+               for fam in graph.families_of( person ):
+                   if fam not in results:
+                      results[fam] = color
+                      stack.extend( graph.children_of( fam ) )
+
+    # only the families in the output are drawn
+    claimed = dict()
+    for color in colors:
+        claimed[color] = 0
+    for fam in results:
+        if fam in the_families:
+           claimed[results[fam]] += 1
+    for color in claimed:
+        print( 'Colour', color, 'claimed', claimed[color], 'families', file=sys.stderr )
+
+    add_stats_count( 'coloured families', sum( claimed.values() ) )
 
-           i_color += 1
     return results
 
 
-options = get_program_options()
+def id_tags_of( jobs ):
+    # the tags used to find people in any of the jobs, for the lean reader
+    results = set()
+    for job in jobs:
+        if job['iditem'] != 'xref':
+           results.add( job['iditem'] )
+    return sorted( results )
+
+
+def branch_starts( jobs ):
+    # The people the indexed reader starts from, and how far it goes from each.
+    # None if all the records are needed.
+    results = []
+    for job in jobs:
+        # a path may go anywhere
+        if job['include'] in ['all', 'path']:
+           return None
+        # all the generations are needed to count the people beyond the detail
+        generations = job['generations']
+        if job['detail'] is not None:
+           generations = None
+        for person in person_ids( job['personid'] ):
+            key = normal_xref( person ).replace( '@', '' )
+            results.append( (key, job['include'], generations) )
+        # the people for coloured lines are found but not output
+        # unless they are reached from the people above
+        if job['color-tree']:
+           for person in person_ids( job['color-tree'] ):
+               key = normal_xref( person ).replace( '@', '' )
+               results.append( (key, None, None) )
+    return results
 
-readgedcom = load_my_module( 'readgedcom', options['libpath'] )
 
-ikey = readgedcom.PARSED_INDI
-fkey = readgedcom.PARSED_FAM
+def load_data( program_options, jobs ):
+    # Read the gedcom file and set up the lookups used for any job.
+    # Returns False if the data can't be used.
+
+    global readgedcom
+    global ikey
+    global fkey
+    global data
+    global graph
+    global labels
+    global xref_index
+    global id_index
+
+    with stats_phase( 'load module' ):
+         if program_options['reader'] == 'lean':
+            readgedcom = LeanReader( id_tags_of( jobs ) )
+         elif program_options['reader'] == 'indexed':
+            readgedcom = IndexedReader( id_tags_of( jobs ), branch_starts( jobs ),
+                                        program_options['cache-dir'], program_options['cache'] )
+         else:
+            readgedcom = load_my_module( 'readgedcom', program_options['libpath'] )
 
-data = readgedcom.read_file( options['infile'] )
+    ikey = readgedcom.PARSED_INDI
+    fkey = readgedcom.PARSED_FAM
 
-# find the people that should be output
-the_individuals = []
-the_families = []
+    with stats_phase( 'read gedcom' ):
+         data = read_data( program_options['infile'], program_options['cache-dir'], program_options['cache'],
+                           program_options['reader'] )
 
-exit_code = 1
+    graph = None
+    labels = dict()
+    xref_index = dict()
+    id_index = dict()
 
-if data_ok():
-   if options_ok( options ):
-      indi = None
-      if options['include'] != 'all':
-         indi_found = find_person( options['personid'], options['iditem'] )
-         if indi_found:
-            if len( indi_found ) == 1:
-               indi = indi_found[0]
-            else:
-               print( 'Found more than one start person', options['personid'], 'in', options['iditem'], file=sys.stderr )
-               sys.exit(exit_code)
+    if not data_ok():
+       return False
+
+    with stats_phase( 'build graph' ):
+         fam_data = dict()
+         if fkey in data:
+            fam_data = data[fkey]
+         graph = FamilyGraph( data[ikey], fam_data )
+
+    with stats_phase( 'build labels' ):
+         labels = build_labels()
+
+    with stats_phase( 'build xref index' ):
+         xref_index = build_xref_index()
+
+    add_stats_count( 'people in data', graph.n_indi() )
+    add_stats_count( 'families in data', graph.n_fam() )
+
+    return True
+
+
+def run_job( job_options, stream=None ):
+    # Produce one output from the loaded data,
+    # written to the given text stream rather than the output option if there is one.
+    # The options should have already been checked.
+    # Returns True if successful.
+
+    global options
+
+    options = job_options
+
+    # find the people that should be output
+    the_individuals.clear()
+    the_families.clear()
+    the_summaries.clear()
+
+    indi = None
+    roots = []
+    if options['include'] != 'all':
+       for person in person_ids( options['personid'] ):
+           with stats_phase( 'find person' ):
+                indi_found = find_person( person, options['iditem'] )
+           if indi_found:
+              if len( indi_found ) == 1:
+                 roots.append( indi_found[0] )
+              else:
+                 print( 'Found more than one start person', person, 'in', options['iditem'], file=sys.stderr )
+                 return False
+           else:
+              print( 'Did not locate start person', person, 'in', options['iditem'], file=sys.stderr )
+              return False
+       # the json tree is from the only one
+       indi = roots[0]
+
+    result = False
+
+    with stats_phase( 'select people' ):
+         if options['component'] is None:
+            selected = get_individuals( options['include'], roots, options['generations'], options['detail'] )
          else:
-            print( 'Did not locate start person', options['personid'], 'in', options['iditem'], file=sys.stderr )
-            sys.exit(exit_code)
+            selected = select_component( options['component'] )
+
+    if selected:
+       add_stats_count( 'selected people', len( the_individuals ) )
+       add_stats_count( 'selected families', len( the_families ) )
+       add_stats_count( 'summary nodes', len( the_summaries ) )
+
+       with stats_phase( 'find colours' ):
+            if options['color-roots']:
+               use_color = find_color_people( options['iditem'], options['include'], options['format'], options['personid'],
+                                              options['color-precedence'], for_roots=True )
+            else:
+               use_color = find_color_people( options['iditem'], options['include'], options['format'], options['color-tree'],
+                                              options['color-precedence'] )
+
+       with stats_phase( 'output ' + options['format'] ):
+            if options['render-cache'] and stream is None:
+               result = render_output( use_color, indi )
+            else:
+               result = write_output( options['output'], options['compress'], use_color, indi, stream )
+
+    return result
+
+
+def parallel_jobs_ok( jobs ):
+    # output from jobs running at the same time can't share a file
+    result = True
+
+    outputs = set()
+    for n, job in enumerate( jobs, start=1 ):
+        if job['output'] is None:
+           print( 'Batch job', n, 'needs an output file to run in parallel', file=sys.stderr )
+           result = False
+        elif os.path.realpath( job['output'] ) in outputs:
+           print( 'Batch job', n, 'has the same output file as another job', file=sys.stderr )
+           result = False
+        else:
+           outputs.add( os.path.realpath( job['output'] ) )
+
+    return result
+
+
+def start_worker( program_options, jobs ):
+    # A forked worker already has a copy of the data.
+    # Otherwise it is loaded again, which will use the parsed data cache if possible.
+    if not data:
+       load_data( program_options, jobs )
+       if program_options['split']:
+          load_components()
+
+
+def run_worker_job( job ):
+    # output from the job goes to its own file, only the result comes back
+    return run_job( job )
+
+
+def run_parallel( jobs, program_options ):
+    # Run the jobs in a pool of processes.
+    # Returns the number of jobs which failed.
+
+    n_workers = min( program_options['jobs'], len( jobs ) )
+
+    # Forked workers share the parent's memory until it is changed,
+    # so keep the garbage collector from touching the loaded data.
+    if 'fork' in multiprocessing.get_all_start_methods():
+       context = multiprocessing.get_context( 'fork' )
+       # gc.freeze is new in Python 3.7
+       if hasattr( gc, 'freeze' ):
+          gc.freeze()
+    else:
+       context = multiprocessing.get_context()
+
+    print( 'Running', len( jobs ), 'jobs in', n_workers, 'processes', file=sys.stderr )
+
+    failures = 0
+    with context.Pool( n_workers, initializer=start_worker, initargs=(program_options, jobs) ) as pool:
+         for ok in pool.imap( run_worker_job, jobs ):
+             if not ok:
+                failures += 1
+
+    return failures
+
+
+def serve_load_jobs( program_options ):
+    # Any person might be asked for, so the indexed reader reads the whole file.
+    job = dict( program_options )
+    job['include'] = 'all'
+    return [job]
+
+
+def serve( program_options ):
+    # Answer requests for outputs until interrupted.
+    # Returns the exit code.
+
+    if not load_data( program_options, serve_load_jobs( program_options ) ):
+       return 1
+
+    if run_stats is not None:
+       flush_stats( program_options['stats-format'] )
+
+    try:
+       server = RenderServer( program_options['serve'], program_options )
+    except OSError as e:
+       print( 'Unable to start server on port', program_options['serve'], ':', e, file=sys.stderr )
+       return 1
+
+    host, port = server.server_address[:2]
+    print( 'Serving on http://' + host + ':' + str( port ) + '/', file=sys.stderr )
+
+    try:
+       server.serve_forever()
+    except KeyboardInterrupt:
+       print( 'Stopped', file=sys.stderr )
+    finally:
+       server.server_close()
+
+    return 0
+
+
+def run_program( program_options ):
+    # Returns the exit code.
+
+    if program_options['personid-file']:
+       program_options['personid'] = read_person_ids( program_options['personid-file'] )
+       if program_options['personid'] is None:
+          return 1
+
+    jobs = [program_options]
+    if program_options['batch']:
+       jobs = read_batch( program_options['batch'], program_options )
+       if jobs is None:
+          return 1
+    elif not options_ok( program_options ):
+       return 1
+
+    if program_options['serve'] is not None:
+       return serve( program_options )
+
+    in_parallel = program_options['jobs'] > 1 and len( jobs ) > 1
+    if in_parallel and not parallel_jobs_ok( jobs ):
+       return 1
+
+    if not load_data( program_options, jobs ):
+       return 1
+
+    if program_options['split']:
+       load_components()
+       jobs = split_jobs( program_options )
+       if jobs is None:
+          return 1
+       # each group has its own output file
+       in_parallel = program_options['jobs'] > 1 and len( jobs ) > 1
+
+    failures = 0
+    if in_parallel:
+       # workers' own phases are not included in the stats
+       with stats_phase( 'parallel jobs' ):
+            failures = run_parallel( jobs, program_options )
+    else:
+       for n, job in enumerate( jobs, start=1 ):
+           if len( jobs ) > 1:
+              print( 'Job', n, 'of', len( jobs ), file=sys.stderr )
+           if not run_job( job ):
+              failures += 1
+
+    if failures:
+       if len( jobs ) > 1:
+          print( failures, 'of', len( jobs ), 'jobs failed', file=sys.stderr )
+       return 1
+
+    return 0
+
+
+def main():
+    global options
+    global run_stats
+
+    options = get_program_options()
+
+    if options['stats']:
+       run_stats = { 'phases':[], 'counts':dict() }
+       tracemalloc.start()
+
+    profiler = None
+    if options['profile']:
+       profiler = cProfile.Profile()
+       profiler.enable()
+
+    try:
+       exit_code = run_program( options )
+
+    finally:
+       if profiler:
+          profiler.disable()
+          profiler.dump_stats( options['profile'] )
+       if run_stats is not None:
+          tracemalloc.stop()
+          flush_stats( options['stats-format'] )
+
+    return exit_code
+
+
+# the state used by the functions above
+# set by load_data for the whole run and run_job for each output
+
+options = dict()
+
+readgedcom = None
+ikey = None
+fkey = None
+data = dict()
+
+# people and families by number, with their links
+graph = None
+
+labels = dict()
+
+# for finding people by their xref or by other id tags
+xref_index = dict()
+id_index = dict()
+
+# the people and families that should be output
+the_individuals = Selection()
+the_families = Selection()
+
+# the people and families in each connected group when splitting
+component_people = []
+component_families = []
+
+# nodes standing in for the people beyond the detail,
+# each is (person, direction, number of people, number of generations)
+the_summaries = []
+
+sink = None
+edge_sink = None
+
+# timing of each phase when --stats is used
+run_stats = None
 
-      if get_individuals( options['include'], indi ):
-         use_color = find_color_people( options['iditem'], options['include'], options['format'], options['color-tree'] )
-         if output_data( options['format'], options['reverse'], options['thick'], use_color, indi ):
-            exit_code = 0
 
-sys.exit( exit_code )
+if __name__ == '__main__':
+   sys.exit( main() )
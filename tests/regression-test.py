@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+
+"""
+Check that the outputs of gedcom-display-format.py are unchanged.
+Each format and include option is run on the example gedcom file
+and on a small synthetic file, and the output is compared byte for byte
+with the saved expected output.
+
+The expected outputs of the formats and options which were in the first
+version of the program were made by that version, so that the test shows
+the output is the same as it was. Use --original to run only those,
+and --program to test another copy of the program.
+
+Use --update to save the current outputs as the expected ones,
+which should be done only when a change to the output is intended.
+
+This code is released under the MIT License: https://opensource.org/licenses/MIT
+Copyright (c) 2022 John A. Andrea
+
+No support provided.
+"""
+
+import sys
+import os
+import re
+import argparse
+import subprocess
+import tempfile
+import difflib
+
+FORMATS = ['dot', 'dot2', 'graphml', 'json', 'cyjs', 'sif', 'csv']
+INCLUDES = ['all', 'ancestors', 'descendents', 'branch']
+
+# the formats of the first version of the program
+ORIGINAL_FORMATS = ['dot', 'dot2', 'graphml', 'json']
+
+# json output is only a tree from one person
+NOT_JSON = ['all', 'branch']
+
+# the synthetic file, always made the same way
+SYNTHETIC_PEOPLE = 300
+SYNTHETIC_SEED = 1
+
+# the files, with the person for the include options and a second person for the path
+GEDCOMS = [ ('skywalker', '6', '8'), ('synthetic', '150', '220') ]
+
+# other options, each run once in the dot2 format unless they choose their own,
+# and whether the first version of the program had them
+EXTRAS = [ ('dates', True, ['--include=branch', '--dates', '--reverse', '--thick', '--thick']),
+           ('colour', True, ['--include=ancestors', '--colouring=1,3,5']),
+           ('precedence', False, ['--include=ancestors', '--colouring=1,3,5', '--colour-precedence=youngest']),
+           ('detail', False, ['--include=branch', '--detail=1', '--format=graphml']),
+           ('layout', False, ['--include=all', '--layout', '--format=dot']),
+           ('refs', False, ['--include=descendents', '--refs', '--compact', '--format=json']),
+           ('generations', False, ['--include=descendents', '--generations=2', '--format=cyjs'])]
+
+
+def get_version():
+    return '1.0.0'
+
+
+def get_program_options():
+    results = dict()
+
+    here = os.path.dirname( os.path.realpath( __file__ ) )
+
+    results['reader'] = 'full'
+    results['libpath'] = '.'
+    results['program'] = os.path.join( here, '..', 'gedcom-display-format.py' )
+    results['expected'] = os.path.join( here, 'expected' )
+    results['original'] = False
+    results['update'] = False
+
+    arg_help = 'Compare the outputs of gedcom-display-format.py with saved expected outputs.'
+    parser = argparse.ArgumentParser( description=arg_help )
+
+    arg_help = 'Show version then exit.'
+    parser.add_argument( '--version', action='version', version=get_version() )
+
+    arg_help = 'The --reader of gedcom-display-format.py. Default: ' + results['reader']
+    arg_help += ' The lean reader is built in, the others need the gedcom library.'
+    parser.add_argument( '--reader', default=results['reader'], type=str, help=arg_help )
+
+    arg_help = 'Location of the gedcom library relative to gedcom-display-format.py. Default: ' + results['libpath']
+    parser.add_argument( '--libpath', default=results['libpath'], type=str, help=arg_help )
+
+    arg_help = 'The copy of gedcom-display-format.py to test. Default is the one above this directory.'
+    parser.add_argument( '--program', default=results['program'], type=str, help=arg_help )
+
+    arg_help = 'Directory of the expected outputs. Default is expected/ next to this program.'
+    parser.add_argument( '--expected', default=results['expected'], type=str, help=arg_help )
+
+    arg_help = 'Run only the formats and options of the first version of the program.'
+    parser.add_argument( '--original', default=results['original'], action='store_true', help=arg_help )
+
+    arg_help = 'Save the current outputs as the expected outputs.'
+    parser.add_argument( '--update', default=results['update'], action='store_true', help=arg_help )
+
+    args = parser.parse_args()
+
+    results['reader'] = args.reader
+    results['libpath'] = args.libpath
+    results['program'] = args.program
+    results['expected'] = args.expected
+    results['original'] = args.original
+    results['update'] = args.update
+
+    return results
+
+
+def program_path( name ):
+    # the other programs are found relative to this one
+    here = os.path.dirname( os.path.realpath( __file__ ) )
+    if name == 'make-synthetic-gedcom.py':
+       return os.path.join( here, '..', 'benchmark', name )
+    return os.path.join( here, '..', 'examples', 'input', name )
+
+
+def make_gedcom( workdir ):
+    file_name = os.path.join( workdir, 'synthetic.ged' )
+
+    command = [sys.executable, program_path( 'make-synthetic-gedcom.py' )]
+    command.append( '--people=' + str( SYNTHETIC_PEOPLE ) )
+    command.append( '--seed=' + str( SYNTHETIC_SEED ) )
+
+    with open( file_name, 'wb' ) as f:
+         subprocess.run( command, stdout=f, stderr=subprocess.DEVNULL, check=True )
+
+    return file_name
+
+
+def test_cases( original_only ):
+    # Returns the name and options of each run, for each gedcom
+    results = []
+
+    for gedcom, person, other in GEDCOMS:
+        for out_format in FORMATS:
+            if original_only and out_format not in ORIGINAL_FORMATS:
+               continue
+            for include in INCLUDES:
+                if out_format == 'json' and include in NOT_JSON:
+                   continue
+                options = ['--format=' + out_format, '--include=' + include]
+                if include != 'all':
+                   options.append( '--personid=' + person )
+                results.append( (gedcom, out_format + '-' + include, options) )
+
+        for name, original, options in EXTRAS:
+            if original_only and not original:
+               continue
+            if not [ option for option in options if option.startswith( '--format=' ) ]:
+               options = options + ['--format=dot2']
+            if '--include=all' not in options:
+               options = options + ['--personid=' + person]
+            results.append( (gedcom, name, options) )
+
+        if not original_only:
+           results.append( (gedcom, 'path', ['--format=dot', '--include=path', '--personid=' + person + ',' + other]) )
+           results.append( (gedcom, 'roots', ['--format=dot', '--include=descendents', '--colour-roots',
+                                              '--personid=' + person + ',' + other]) )
+
+    return results
+
+
+def program_has_options( settings ):
+    # Returns the set of options listed in the help of the program,
+    # because an earlier version of the program might not have them all.
+    command = [sys.executable, settings['program'], '--help']
+    run = subprocess.run( command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL )
+    help_text = run.stdout.decode( 'utf-8', errors='replace' )
+    return set( re.findall( r'--[a-z][a-z-]*', help_text ) )
+
+
+def run_case( settings, program_options, file_name, options ):
+    # Returns the output, or None if the run failed.
+    command = [sys.executable, settings['program']]
+    command.append( '--libpath=' + settings['libpath'] )
+    if settings['reader'] != 'full':
+       command.append( '--reader=' + settings['reader'] )
+    if '--no-cache' in program_options:
+       command.append( '--no-cache' )
+    command.extend( options )
+    command.append( file_name )
+
+    run = subprocess.run( command, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+    if run.returncode != 0:
+       print( run.stderr.decode( 'utf-8', errors='replace' ), file=sys.stderr )
+       return None
+    return run.stdout
+
+
+def show_difference( expected, output ):
+    lines = difflib.unified_diff( expected.decode( 'utf-8', errors='replace' ).splitlines(),
+                                  output.decode( 'utf-8', errors='replace' ).splitlines(),
+                                  'expected', 'output', lineterm='', n=1 )
+    for n, line in enumerate( lines ):
+        if n >= 20:
+           print( '   ...', file=sys.stderr )
+           break
+        print( '   ' + line, file=sys.stderr )
+
+
+def run_tests( settings, workdir ):
+    # Returns the number of failures.
+
+    files = dict()
+    files['skywalker'] = program_path( 'skywalker.ged' )
+    files['synthetic'] = make_gedcom( workdir )
+
+    if settings['update']:
+       os.makedirs( settings['expected'], exist_ok=True )
+
+    program_options = program_has_options( settings )
+
+    cases = test_cases( settings['original'] )
+    failures = 0
+
+    for gedcom, name, options in cases:
+        expected_name = os.path.join( settings['expected'], gedcom + '-' + name + '.out' )
+
+        output = run_case( settings, program_options, files[gedcom], options )
+        if output is None:
+           print( 'FAILED to run', gedcom, name, ' '.join( options ), file=sys.stderr )
+           failures += 1
+           continue
+
+        if settings['update']:
+           with open( expected_name, 'wb' ) as f:
+                f.write( output )
+           continue
+
+        if not os.path.isfile( expected_name ):
+           print( 'MISSING expected output', expected_name, file=sys.stderr )
+           failures += 1
+           continue
+
+        with open( expected_name, 'rb' ) as f:
+             expected = f.read()
+
+        if output != expected:
+           print( 'CHANGED', gedcom, name, ' '.join( options ), file=sys.stderr )
+           show_difference( expected, output )
+           failures += 1
+
+    if settings['update']:
+       print( 'Saved', len( cases ) - failures, 'expected outputs in', settings['expected'], file=sys.stderr )
+    else:
+       print( len( cases ) - failures, 'of', len( cases ), 'outputs unchanged', file=sys.stderr )
+
+    return failures
+
+
+options = get_program_options()
+
+with tempfile.TemporaryDirectory() as temp_dir:
+     n_failed = run_tests( options, temp_dir )
+
+sys.exit( 1 if n_failed else 0 )